@@ -0,0 +1,210 @@
+from typing import Any
+from config import PathVariable, ATTACHMENT_SETTINGS, ATTACHMENT_CACHE_MAX_BYTES, NOTEBOOK_CONVERTER_BACKEND, NOTEBOOK_SANITIZE_SETTINGS
+from disk_cache import DiskCache
+from data_maker import DataMaker
+import hashlib
+import difflib
+import json
+import os
+import re
+
+
+# Markdown files are compared by sections, each one starts with a heading
+MARKDOWN_SECTION_PATTERN = re.compile(r"\n(?=#{1,6} )")
+
+
+
+class AttachmentCache(DiskCache):
+
+    def make_key(self, content_hash: str, extension: str) -> str:
+        """
+        Function makes a cache key from hash of the file content and settings of conversion
+        The same file attached again (also with another name) gives the same key
+
+        Args:
+            content_hash (str): SHA-256 of the file content
+            extension (str): Extension of the file (".ipynb" or ".md")
+
+        Returns:
+            str: Hash used as name of the cache entry
+        """
+
+        settings = json.dumps([NOTEBOOK_CONVERTER_BACKEND, NOTEBOOK_SANITIZE_SETTINGS, ATTACHMENT_SETTINGS], sort_keys=True)
+
+        return hashlib.sha256(f"{content_hash}|{extension}|{settings}".encode("utf-8")).hexdigest()
+
+
+
+class AttachmentProcessor:
+
+    def __init__(self, maker: DataMaker | None = None, attachment_cache: AttachmentCache | None = None) -> None:
+        self.maker = maker if maker is not None else DataMaker()
+        self.attachment_cache = attachment_cache if attachment_cache is not None else AttachmentCache(
+            cache_dir=os.path.join(PathVariable.CACHE_PATH.value, "attachments"),
+            max_bytes=ATTACHMENT_CACHE_MAX_BYTES
+        )
+        self.failed_attachments = []
+
+
+    def process_files(self, files: list[Any]) -> list[dict[str, Any]]:
+        """
+        Function converts uploaded files to Markdown, files over the limits or not converted are saved in 'failed_attachments'
+
+        Args:
+            files (list[Any]): Uploaded files (objects with 'name', 'size' and 'getvalue()', e.g. from 'st.chat_input')
+
+        Returns:
+            list[dict[str, Any]]: Attachments with "name", "markdown", "cells", "content_hash" and "cached"
+        """
+
+        self.failed_attachments = []
+        attachments = []
+        for i, file in enumerate(files):
+            if i >= ATTACHMENT_SETTINGS["max_files"]:
+                self.failed_attachments.append({"name" : file.name, "error" : f"Only {ATTACHMENT_SETTINGS['max_files']} files per message"})
+                continue
+
+            # Size is checked before the content is read
+            if file.size > ATTACHMENT_SETTINGS["max_file_bytes"]:
+                self.failed_attachments.append({"name" : file.name, "error" : f"File larger than {ATTACHMENT_SETTINGS['max_file_bytes'] // (1024 * 1024)} MB"})
+                continue
+
+            if isinstance(attachment := self.process_bytes(file.name, file.getvalue()), bool):
+                self.failed_attachments.append({"name" : file.name, "error" : "File could not be converted"})
+                continue
+
+            attachments.append(attachment)
+
+        return attachments
+
+
+    def process_bytes(self, file_name: str, data: bytes) -> dict[str, Any] | bool:
+        """
+        Function converts content of .ipynb or .md file to Markdown in memory
+        Outputs of notebooks are stripped and results are cached by hash of the content.
+        Cells (sections of .md) are kept separately to compare versions of the file.
+
+        Args:
+            file_name (str): Name of the file
+            data (bytes): Content of the file
+
+        Returns:
+            dict[str, Any] | bool: Attachment with "name", "markdown", "cells", "content_hash" and "cached"
+                                   or bool (False) as error
+        """
+
+        extension = os.path.splitext(file_name)[1].lower()
+        if extension not in (".ipynb", ".md"):
+            return False
+
+        content_hash = hashlib.sha256(data).hexdigest()
+        cache_key = self.attachment_cache.make_key(content_hash, extension)
+        if (cached_attachment := self.attachment_cache.get(cache_key)) is not None and "cells" in cached_attachment:
+            return {**cached_attachment, "name" : file_name, "content_hash" : content_hash, "cached" : True}
+
+        try:
+            text = data.decode("utf-8")
+
+        except Exception as e:
+            return False
+
+        # Notebook is converted once, with the native backend the whole Markdown is made of its cells
+        if extension == ".ipynb":
+            cells = self.maker.convert_notebook_source_to_cells(text)
+            if isinstance(cells, bool):
+                return False
+
+            if self.maker.converter.backend == "native":
+                markdown = "\n\n".join(cells) + "\n"
+            else:
+                markdown = self.maker.convert_notebook_source(text)
+        else:
+            markdown = text
+            cells = [section for section in MARKDOWN_SECTION_PATTERN.split(text) if section.strip()]
+
+        if isinstance(markdown, bool) or isinstance(cells, bool):
+            return False
+
+        # Very long files are cut, the beginning and the end are kept
+        max_chars = ATTACHMENT_SETTINGS["max_markdown_chars"]
+        if len(markdown) > max_chars:
+            markdown = f"{markdown[:max_chars // 2]}\n\n... ({len(markdown) - 2 * (max_chars // 2)} characters truncated) ...\n\n{markdown[-(max_chars // 2):]}"
+
+        self.attachment_cache.put(cache_key, {"markdown" : markdown, "cells" : cells})
+
+        return {"name" : file_name, "markdown" : markdown, "cells" : cells, "content_hash" : content_hash, "cached" : False}
+
+
+    def make_attachment_prompt(self, attachment: dict[str, Any], chat_attachments: dict[str, dict[str, Any]]) -> str:
+        """
+        Function makes the part of message with the attachment for the model
+        A file already sent in the chat is only referenced, a new version of it (the same name) is sent
+        as a cell-level diff, if the diff is small enough compared to the whole file
+
+        Args:
+            attachment (dict[str, Any]): Attachment from 'process_files(...)'
+            chat_attachments (dict[str, dict[str, Any]]): Attachments sent in the chat by name (see 'LLM.chat_attachments')
+
+        Returns:
+            str: Text of the attachment for the model
+        """
+
+        full_prompt = f"File {attachment['name']} as Markdown:<br>{attachment['markdown']}"
+        if not ATTACHMENT_SETTINGS["send_diffs"]:
+            return full_prompt
+
+        if (earlier_attachment := chat_attachments.get(attachment["name"])) is None:
+            same_content_name = next((name for name, sent in chat_attachments.items() if sent["content_hash"] == attachment["content_hash"]), None)
+            if same_content_name is not None:
+                return f"File {attachment['name']} has the same content as file {same_content_name} attached earlier."
+
+            return full_prompt
+
+        if earlier_attachment["content_hash"] == attachment["content_hash"]:
+            return f"File {attachment['name']} is unchanged since version {earlier_attachment['version']} attached earlier."
+
+        cells_diff = make_cells_diff(earlier_attachment["cells"], attachment["cells"])
+        if len(cells_diff) > ATTACHMENT_SETTINGS["max_diff_ratio"] * len(attachment["markdown"]):
+            return full_prompt
+
+        return (
+            f"File {attachment['name']} is version {earlier_attachment['version'] + 1} of the file attached earlier "
+            f"(version {earlier_attachment['version']}). Only changed cells are given, the other cells are the same as in version "
+            f"{earlier_attachment['version']}:<br>{cells_diff}"
+        )
+
+
+
+def make_cells_diff(earlier_cells: list[str], cells: list[str]) -> str:
+    """
+    Function makes a compact description of changes between two versions of cells
+    Unchanged cells are left out, changed and added cells are given with their new content
+
+    Args:
+        earlier_cells (list[str]): Cells of the earlier version
+        cells (list[str]): Cells of the new version
+
+    Returns:
+        str: Diff in Markdown format
+    """
+
+    def cells_range(start: int, end: int) -> str:
+        return f"cell {start + 1}" if end - start == 1 else f"cells {start + 1}-{end}"
+
+    diff_parts = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(a=earlier_cells, b=cells, autojunk=False).get_opcodes():
+        if tag == "equal":
+            continue
+
+        if tag == "delete":
+            diff_parts.append(f"#### Removed {cells_range(i1, i2)} of the earlier version")
+            continue
+
+        if tag == "replace":
+            diff_parts.append(f"#### Changed {cells_range(i1, i2)} of the earlier version, now {cells_range(j1, j2)}:")
+        else:
+            diff_parts.append(f"#### Added {cells_range(j1, j2)} {f'after cell {i1} of the earlier version' if i1 else 'at the beginning'}:")
+
+        diff_parts.extend(f"Cell {j + 1}:\n{cells[j]}" for j in range(j1, j2))
+
+    return "\n\n".join(diff_parts) if diff_parts else "No changes in cells."
@@ -0,0 +1,248 @@
+from typing import Any
+from datetime import datetime
+import threading
+import uuid
+import json
+import time
+import os
+
+
+
+class ChatStore:
+
+    # Shared by all objects in the process, each session creates its own store over the same directory
+    _lock = threading.Lock()
+
+    def __init__(self, store_dir: str, read_block_size: int = 64 * 1024) -> None:
+        self.store_dir = store_dir
+        self.read_block_size = read_block_size
+
+        os.makedirs(self.store_dir, exist_ok=True)
+
+
+    def _session_path(self, session_id: str) -> str:
+        """Function returns path of JSONL file with messages of the session"""
+
+        return os.path.join(self.store_dir, f"{session_id}.jsonl")
+
+
+    def _summary_path(self, session_id: str) -> str:
+        """Function returns path of JSON file with summary of compacted messages of the session"""
+
+        return os.path.join(self.store_dir, f"{session_id}.summary.json")
+
+
+    def new_session(self) -> str:
+        """
+        Function returns ID of a new chat session, its file is created with the first message
+
+        Returns:
+            str: ID of the session (date and random part, so IDs sort by time)
+        """
+
+        return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+    def append(self, session_id: str, message: dict[str, Any]) -> bool:
+        """
+        Function appends message to the session, saved messages are never rewritten
+
+        Args:
+            session_id (str): ID of the session
+            message (dict[str, Any]): Message with "role", "content" (shown text), "avatar"
+                                      and optionally "llm_content" (text sent to the model, if different)
+
+        Returns:
+            bool: Signal if the message has been saved correctly
+        """
+
+        try:
+            line = json.dumps({**message, "created_at" : time.time()}, ensure_ascii=False)
+            with ChatStore._lock:
+                with open(self._session_path(session_id), "a", encoding="utf-8") as f:
+                    f.write(f"{line}\n")
+
+        except Exception as e:
+            return False
+
+        return True
+
+
+    def load_messages(self, session_id: str, limit: int, skip: int = 0) -> list[dict[str, Any]]:
+        """
+        Function returns 'limit' messages of the session that come before the last 'skip' ones
+        The file is read from the end in blocks, so loading the latest messages does not depend on its length
+
+        Args:
+            session_id (str): ID of the session
+            limit (int): Number of messages to return
+            skip (int, optional): Number of the latest messages to leave out. Defaults to 0.
+
+        Returns:
+            list[dict[str, Any]]: Messages in chronological order (empty if the session has no file)
+        """
+
+        lines = self._read_last_lines(self._session_path(session_id), limit + skip)
+        messages = []
+        for line in lines[:len(lines) - skip] if skip else lines:
+            try:
+                messages.append(json.loads(line))
+
+            # Line broken by a crash while writing is skipped
+            except Exception as e:
+                continue
+
+        return messages
+
+
+    def count_messages(self, session_id: str) -> int:
+        """
+        Function returns number of messages saved in the session
+
+        Args:
+            session_id (str): ID of the session
+
+        Returns:
+            int: Number of messages (0 if the session has no file)
+        """
+
+        path = self._session_path(session_id)
+        if not os.path.exists(path):
+            return 0
+
+        count = 0
+        with open(path, "rb") as f:
+            while block := f.read(self.read_block_size):
+                count += block.count(b"\n")
+
+        return count
+
+
+    def save_summary(self, session_id: str, summary: str, kept_messages: int) -> bool:
+        """
+        Function saves summary of the session that replaces its older messages in history of the model
+        The last 'kept_messages' messages saved so far (and all next ones) stay in history verbatim
+
+        Args:
+            session_id (str): ID of the session
+            summary (str): Summary of the compacted messages
+            kept_messages (int): Number of the latest messages not covered by the summary
+
+        Returns:
+            bool: Signal if the summary has been saved correctly
+        """
+
+        summary_path = self._summary_path(session_id)
+        tmp_path = f"{summary_path}.{threading.get_ident()}.tmp"
+        try:
+            with ChatStore._lock:
+                summary_data = {
+                    "summary"       : summary,
+                    "message_count" : max(self.count_messages(session_id) - kept_messages, 0),
+                }
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(summary_data, f, ensure_ascii=False)
+                os.replace(tmp_path, summary_path)
+
+        except Exception as e:
+            return False
+
+        return True
+
+
+    def load_model_history(self, session_id: str) -> tuple[str | None, list[dict[str, Any]]]:
+        """
+        Function returns history of the session for the model: the summary of compacted messages
+        and the messages after it, so a continued session starts like the chat before it was closed
+
+        Args:
+            session_id (str): ID of the session
+
+        Returns:
+            tuple[str | None, list[dict[str, Any]]]: Summary (None if the session was never compacted)
+                                                     and messages not covered by it in chronological order
+        """
+
+        summary, message_count = None, 0
+        try:
+            with open(self._summary_path(session_id), "r", encoding="utf-8") as f:
+                summary_data = json.load(f)
+            summary, message_count = summary_data["summary"], summary_data["message_count"]
+
+        except Exception as e:
+            pass
+
+        return summary, self.load_messages(session_id, limit=self.count_messages(session_id) - message_count)
+
+
+    def _read_last_lines(self, path: str, count: int) -> list[str]:
+        """
+        Function reads the last 'count' lines of file from its end
+
+        Args:
+            path (str): Path of the file
+            count (int): Number of lines
+
+        Returns:
+            list[str]: Lines in order of the file
+        """
+
+        if count <= 0 or not os.path.exists(path):
+            return []
+
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            data = b""
+
+            # One more line than needed is read, because the first one in the buffer can be incomplete
+            while position > 0 and data.count(b"\n") <= count:
+                read_size = min(self.read_block_size, position)
+                position -= read_size
+                f.seek(position)
+                data = f.read(read_size) + data
+
+        lines = [line for line in data.decode("utf-8", errors="replace").split("\n") if line.strip()]
+
+        return lines[-count:]
+
+
+    def list_sessions(self, limit: int | None = None) -> list[str]:
+        """
+        Function returns IDs of saved sessions, the most recently used first
+
+        Args:
+            limit (int | None, optional): Maximum number of sessions. Defaults to None (all).
+
+        Returns:
+            list[str]: IDs of sessions
+        """
+
+        session_files = [file for file in os.listdir(self.store_dir) if file.endswith(".jsonl")]
+        session_files.sort(key=lambda file: os.path.getmtime(os.path.join(self.store_dir, file)), reverse=True)
+
+        return [os.path.splitext(file)[0] for file in session_files[:limit]]
+
+
+    def get_session_title(self, session_id: str, max_chars: int = 40) -> str:
+        """
+        Function returns title of the session made from its first message of the user
+
+        Args:
+            session_id (str): ID of the session
+            max_chars (int, optional): Maximum length of the title. Defaults to 40.
+
+        Returns:
+            str: Title of the session
+        """
+
+        try:
+            with open(self._session_path(session_id), "r", encoding="utf-8") as f:
+                for line in f:
+                    if (message := json.loads(line)).get("role") == "user":
+                        return message["content"].replace("<br>", " ")[:max_chars]
+
+        except Exception as e:
+            pass
+
+        return "New chat"
@@ -0,0 +1,79 @@
+from google import genai
+import threading
+import hashlib
+import kaggle
+import os
+
+
+
+class ClientRegistry:
+
+    def __init__(self) -> None:
+        self._gemini_clients = {}
+        self._kaggle_apis = {}
+        self._lock = threading.Lock()
+
+
+    def _make_key(self, *credentials: str | None) -> str:
+        """Function makes key of the credential set, secrets are kept only as a hash"""
+
+        return hashlib.sha256("|".join(str(credential) for credential in credentials).encode("utf-8")).hexdigest()
+
+
+    def get_gemini_client(self, api_key: str) -> genai.Client:
+        """
+        Function returns Gemini client shared in the process for the given API Key
+        One client keeps one pool of HTTP connections, so it is reused by all sessions and reruns
+
+        Args:
+            api_key (str): API Key from Google AI Studio
+
+        Returns:
+            genai.Client: Client of Gemini API
+        """
+
+        client_key = self._make_key(api_key)
+        with self._lock:
+            if client_key not in self._gemini_clients:
+                self._gemini_clients[client_key] = genai.Client(api_key=api_key)
+
+            return self._gemini_clients[client_key]
+
+
+    def get_kaggle_credentials_key(self) -> str:
+        """
+        Function returns key of current Kaggle credentials (environment variables or config directory)
+
+        Returns:
+            str: Hash of Kaggle credentials
+        """
+
+        return self._make_key(
+            os.environ.get("KAGGLE_USERNAME"),
+            os.environ.get("KAGGLE_KEY"),
+            os.environ.get("KAGGLE_CONFIG_DIR")
+        )
+
+
+    def get_kaggle_api(self) -> kaggle.KaggleApi:
+        """
+        Function returns authenticated Kaggle API shared in the process for the current credentials
+        Credentials are read by Kaggle from environment variables or 'kaggle.json'
+
+        Returns:
+            kaggle.KaggleApi: Authenticated Kaggle API
+        """
+
+        client_key = self.get_kaggle_credentials_key()
+        with self._lock:
+            if client_key not in self._kaggle_apis:
+                api = kaggle.KaggleApi()
+                api.authenticate()
+                self._kaggle_apis[client_key] = api
+
+            return self._kaggle_apis[client_key]
+
+
+
+# Registry shared by all Streamlit sessions of the process
+client_registry = ClientRegistry()
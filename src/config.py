@@ -6,9 +6,110 @@ MAIN_FILE_PATH = os.path.dirname(os.path.abspath(sys.argv[0]))
 ASSETS_SUBDIR = "assets"
 PAGES_SUBDIR = "pages"
 
+# Number of concurrent requests used to pull kernels from Kaggle
+KAGGLE_MAX_WORKERS = 8
+
+# Upper limit of the on-disk cache with pulled kernels (in bytes)
+KERNEL_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Upper limit of the on-disk cache with generated notebooks (in bytes)
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Upper limit of the on-disk cache with notebooks of finished jobs, used by AI-Chat (in bytes)
+CORPUS_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+# Number of processes used to convert notebooks to Markdown
+NOTEBOOK_CONVERT_MAX_WORKERS = os.cpu_count() or 1
+
+# Number of notebook generation jobs running at the same time, the next ones wait in the queue
+JOB_RUNNER_MAX_WORKERS = 4
+
+# Seconds between refreshes of job status on the Notebook Creator page
+JOB_POLL_INTERVAL = 1.0
+
+# Backend of notebook to Markdown conversion - "native" or "nbconvert"
+NOTEBOOK_CONVERTER_BACKEND = "native"
+
+# Save downloaded notebooks in the notebook store, only needed for debugging
+SAVE_DOWNLOADED_NOTEBOOKS = False
+
+# Compression and retention of the notebook store (age and interval in seconds, size in bytes)
+NOTEBOOK_STORE_SETTINGS = {
+    "compress"           : True,
+    "max_age"            : 7 * 24 * 3600,
+    "max_total_bytes"    : 1024 * 1024 * 1024,
+    "retention_interval" : 3600,
+}
+
+# Part of the model input limit kept free when notebooks are packed into the prompt
+PROMPT_TOKENS_RESERVE_RATIO = 0.05
+
+# Number of times notebooks are packed again when the exact count of the prompt is over the limit
+PROMPT_PACKING_MAX_ATTEMPTS = 3
+
+# Generate notebooks with JSON response schema (structured output)
+STRUCTURED_GENERATION = True
+
+# Limits of repeating generation of invalid notebooks (see 'RetryPolicy')
+GENERATION_RETRY_SETTINGS = {
+    "max_attempts" : 3,
+    "base_delay"   : 2.0,
+    "max_delay"    : 30.0,
+    "deadline"     : 600.0,
+}
+
+# Long-context (map-reduce) mode: concurrent summaries of shards and output limit of one digest
+MAP_REDUCE_SETTINGS = {
+    "max_workers"       : 4,
+    "max_output_tokens" : 2048,
+    "shard_tokens"      : 100000,
+}
+
+# Context cache of notebooks repeated between generations and chat (ttl and refresh_margin in seconds),
+# corpora smaller than 'min_tokens' are sent normally
+CONTEXT_CACHE_SETTINGS = {
+    "enabled"        : True,
+    "ttl"            : 3600,
+    "refresh_margin" : 60,
+    "min_tokens"     : 4096,
+}
+
+# Compaction of AI-Chat history: over 'max_tokens' older turns are summarized, the last turns are kept verbatim
+CHAT_HISTORY_SETTINGS = {
+    "max_tokens"                : 32000,
+    "keep_recent_turns"         : 4,
+    "summary_max_output_tokens" : 1024,
+    "summary_max_workers"       : 2,
+}
+
+# Number of AI-Chat messages rendered at once (older ones are loaded on demand) and saved sessions listed
+CHAT_RENDER_LIMIT = 20
+CHAT_SESSIONS_LIMIT = 20
+
+# Limits of files attached in AI-Chat (size of upload in bytes, length of converted Markdown in characters)
+# New versions of files already sent in the chat are sent as cell-level diffs, if not longer than 'max_diff_ratio' of the file
+ATTACHMENT_SETTINGS = {
+    "max_files"          : 5,
+    "max_file_bytes"     : 10 * 1024 * 1024,
+    "max_markdown_chars" : 200000,
+    "send_diffs"         : True,
+    "max_diff_ratio"     : 0.5,
+}
+
+# Upper limit of the on-disk cache with converted attachments (in bytes)
+ATTACHMENT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Settings of stripping outputs from notebooks before conversion (see 'NotebookSanitizer'), None turns it off
+NOTEBOOK_SANITIZE_SETTINGS = {
+    "max_output_chars"     : 2000,
+    "max_outputs_per_cell" : 5,
+}
+
 class PathVariable(Enum):
     NOTEBOOK_PATH = os.path.join(MAIN_FILE_PATH, ASSETS_SUBDIR, "notebook")
     SAVE_PATH =     os.path.join(MAIN_FILE_PATH, ASSETS_SUBDIR, "save")
     TEMPLATE_PATH = os.path.join(MAIN_FILE_PATH, ASSETS_SUBDIR, "template")
     TMP_PATH =      os.path.join(MAIN_FILE_PATH, ASSETS_SUBDIR, "tmp")
+    CACHE_PATH =    os.path.join(MAIN_FILE_PATH, ASSETS_SUBDIR, "cache")
+    CHAT_PATH =     os.path.join(MAIN_FILE_PATH, ASSETS_SUBDIR, "chat")
     PAGES_PATH =    os.path.join(MAIN_FILE_PATH, PAGES_SUBDIR)
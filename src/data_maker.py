@@ -1,39 +1,125 @@
-from typing import Any
-from config import PathVariable
+from typing import Any, Callable
+from config import PathVariable, NOTEBOOK_CONVERTER_BACKEND, NOTEBOOK_SANITIZE_SETTINGS, NOTEBOOK_STORE_SETTINGS
+from notebook_converter import NotebookConverter
+from notebook_sanitizer import NotebookSanitizer
+from notebook_store import NotebookStore
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from nbconvert import MarkdownExporter
-import nbformat
+import multiprocessing
+import threading
 import textwrap
 import json
 import os
 
 
+# DataMakers created once in each worker process of the conversion pool (one per configuration)
+_worker_data_makers = {}
+
+# Saving of generated notebooks is shared by all sessions and background jobs of the process
+_save_lock = threading.Lock()
+
+# Pool of conversion processes shared by all sessions and background jobs of the process
+_convert_pool = None
+_convert_pool_lock = threading.Lock()
+
+
+
+def _get_convert_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Function returns the conversion pool, it is created on the first use with 'max_workers' processes
+    Workers are started by a fork server (or spawned), forking the app from job threads could copy held locks
+
+    Args:
+        max_workers (int): Number of processes of a new pool
+
+    Returns:
+        ProcessPoolExecutor: Pool of the process
+    """
+    global _convert_pool
+    
+    with _convert_pool_lock:
+        if _convert_pool is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _convert_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(start_method))
+        
+        return _convert_pool
+
+
+
+def _reset_convert_pool(broken_pool: ProcessPoolExecutor) -> None:
+    """Function drops the broken pool (e.g. a worker was killed), the next conversion creates a new one"""
+    global _convert_pool
+    
+    with _convert_pool_lock:
+        if _convert_pool is broken_pool:
+            _convert_pool = None
+    
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+
+
+
+def _convert_notebook_worker(notebook_source: str, converter_backend: str,
+                             sanitize_settings: dict[str, Any] | None) -> tuple[str | bool, dict[str, int]]:
+    """
+    Function converts a notebook inside a worker process of 'ProcessPoolExecutor'
+    The converter is created once per process and reused for next notebooks
+
+    Args:
+        notebook_source (str): Notebook in JSON format as text
+        converter_backend (str): Backend of conversion - "native" or "nbconvert"
+        sanitize_settings (dict[str, Any] | None): Settings of 'NotebookSanitizer' or None to skip sanitizing
+
+    Returns:
+        tuple[str | bool, dict[str, int]]: Notebook in Markdown format and sanitize report
+    """
+    
+    maker_key = (converter_backend, json.dumps(sanitize_settings, sort_keys=True))
+    if maker_key not in _worker_data_makers:
+        _worker_data_makers[maker_key] = DataMaker(converter_backend, sanitize_settings)
+    
+    return _worker_data_makers[maker_key]._convert_notebook_source_with_report(notebook_source)
+
+
 
 class DataMaker:
 
-    def __init__(self) -> None:
-        self.markdown_exporter = MarkdownExporter()
+    def __init__(self, converter_backend: str = NOTEBOOK_CONVERTER_BACKEND,
+                 sanitize_settings: dict[str, Any] | None = NOTEBOOK_SANITIZE_SETTINGS) -> None:
+        self.converter = NotebookConverter(converter_backend)
+        self.sanitize_settings = sanitize_settings
+        self.sanitizer = NotebookSanitizer(**sanitize_settings) if sanitize_settings is not None else None
+        self.notebook_store = NotebookStore(
+            store_dir=PathVariable.NOTEBOOK_PATH.value,
+            compress=NOTEBOOK_STORE_SETTINGS["compress"]
+        )
+        self.failed_notebooks = []
+        self.skipped_notebooks = []
+        self.sanitize_reports = {}
         
         
     def prepare_data_dir(self) -> None:
-        """Function checks if folders exist and cleans up with notebooks on new launches"""
+        """Function checks if folders exist and applies retention policy of the notebook store"""
         
         # Create directories in non-existent directories
         for dir_path in [path_value.value for path_value in PathVariable]:
             os.makedirs(dir_path, exist_ok=True)
             
-        # If the directory is not empty, clean it
-        NOTEBOOK_PATH = PathVariable.NOTEBOOK_PATH.value
-        if os.listdir(NOTEBOOK_PATH):
-            for file in os.listdir(NOTEBOOK_PATH):
-                if os.path.isfile(os.path.join(NOTEBOOK_PATH, file)):
-                    os.remove(os.path.join(NOTEBOOK_PATH, file))
+        # Old notebooks are removed by age and total size, the ones of other sessions are kept
+        # Reruns of the page do not walk the store again before 'retention_interval'
+        self.notebook_store.apply_retention(
+            max_age=NOTEBOOK_STORE_SETTINGS["max_age"],
+            max_total_bytes=NOTEBOOK_STORE_SETTINGS["max_total_bytes"],
+            interval=NOTEBOOK_STORE_SETTINGS["retention_interval"]
+        )
                   
                     
     def download_notebook(self, kernel_spec: dict[str, Any]) -> bool:
         """
-        Function to save notebook in JSON format to .ipynb file locally
-        From this notebook, a prompt is created for the model
+        Function to save notebook in JSON format in the notebook store locally
+        The prompt is created from 'source' in memory, the store is never read by the pipeline (it is only for debugging,
+        pulled kernels are cached in 'KernelCache')
+        Notebooks are content-addressed, the same notebook is saved only once
 
         Args:
             kernel_spec (dict[str, Any]): Dict with kernel specifications
@@ -43,16 +129,7 @@ class DataMaker:
         """
         
         try:
-            with open(
-                file=os.path.join(PathVariable.NOTEBOOK_PATH.value, f"{kernel_spec['slug']}.ipynb"),
-                mode="w",
-                encoding="utf-8"
-            ) as f:
-                json.dump(
-                    obj=json.loads(kernel_spec["source"]),
-                    fp=f,
-                    indent=4
-                )
+            self.notebook_store.put(kernel_spec)
                     
         except Exception as e:
             return False
@@ -98,43 +175,185 @@ class DataMaker:
         """)
 
 
-    def convert_ipynb_to_markdown(self, current_file: str | Any) -> str | bool:
+    def _convert_notebooks(self, notebook_sources: list[str], max_workers: int = 1) -> list[tuple[str | bool, dict[str, int]]]:
         """
-        Function that converts .ipynb notebook to Markdown
+        Function converts many notebooks to Markdown
+        With 'max_workers' greater than 1 notebooks are converted in the process pool shared by all jobs
 
         Args:
-            current_file (str|Any): Name of notebook .ipynb
+            notebook_sources (list[str]): Notebooks in JSON format as text
+            max_workers (int, optional): Number of processes for conversion, used when the pool is created. Defaults to 1.
 
         Returns:
-            str | bool: Notebook in Markdown format
+            list[tuple[str | bool, dict[str, int]]]: Notebooks in Markdown format (False for failed ones) with sanitize reports
+                                                     in order of 'notebook_sources'
         """
+        assert max_workers > 0, "Number of workers must be positive"
         
-        if isinstance(current_file, str):
-            if os.path.splitext(current_file)[1] != ".ipynb":
-                return False
+        if max_workers == 1 or len(notebook_sources) < 2:
+            return [self._convert_notebook_source_with_report(notebook_source) for notebook_source in notebook_sources]
+        
+        executor = _get_convert_pool(max_workers)
+        try:
+            futures = [
+                executor.submit(_convert_notebook_worker, notebook_source, self.converter.backend, self.sanitize_settings)
+                for notebook_source in notebook_sources
+            ]
+        
+        except BrokenProcessPool as e:
+            _reset_convert_pool(executor)
+            return [(False, {"chars_saved" : 0, "tokens_saved" : 0}) for _ in notebook_sources]
+        
+        notebooks_markdown = []
+        for future in futures:
+            try:
+                notebooks_markdown.append(future.result())
             
+            except BrokenProcessPool as e:
+                _reset_convert_pool(executor)
+                notebooks_markdown.append((False, {"chars_saved" : 0, "tokens_saved" : 0}))
+                
+            except Exception as e:
+                notebooks_markdown.append((False, {"chars_saved" : 0, "tokens_saved" : 0}))
+        
+        return notebooks_markdown
+    
+    
+    def _convert_notebook_source_with_report(self, notebook_source: str) -> tuple[str | bool, dict[str, int]]:
+        """
+        Function parses notebook, strips its outputs with sanitizer and converts it to Markdown
+
+        Args:
+            notebook_source (str): Notebook in JSON format as text
+
+        Returns:
+            tuple[str | bool, dict[str, int]]: Notebook in Markdown format and report with saved characters and tokens
+        """
+        
+        sanitize_report = {"chars_saved" : 0, "tokens_saved" : 0}
+        try:
+            notebook = json.loads(notebook_source)
+            if self.sanitizer is not None:
+                notebook, sanitize_report = self.sanitizer.sanitize(notebook)
+                
+            body = self.converter.convert_notebook(notebook)
+            
+        except Exception as e:
+            return False, sanitize_report
+        
+        return body, sanitize_report
+    
+    
+    def convert_notebook_source(self, notebook_source: str) -> str | bool:
+        """
+        Function that converts notebook from 'source' of kernel specification to Markdown
+        Conversion is made in memory, without saving and reading .ipynb file
+
+        Args:
+            notebook_source (str): Notebook in JSON format as text
+
+        Returns:
+            str | bool: Notebook in Markdown format
+        """
+        
+        return self._convert_notebook_source_with_report(notebook_source)[0]
+    
+    
+    def convert_notebook_source_to_cells(self, notebook_source: str) -> list[str] | bool:
+        """
+        Function converts notebook like 'convert_notebook_source(...)' but returns every cell separately
+        Outputs are stripped with sanitizer before conversion
+
+        Args:
+            notebook_source (str): Notebook in JSON format as text
+
+        Returns:
+            list[str] | bool: Cells in Markdown format
+        """
+        
         try:
-            with open(current_file, "r", encoding="utf-8") as f:
-                notebook_content = nbformat.read(f, as_version=4)
-                body, _ = self.markdown_exporter.from_notebook_node(notebook_content)
+            notebook = json.loads(notebook_source)
+            if self.sanitizer is not None:
+                notebook, _ = self.sanitizer.sanitize(notebook)
                 
+            return self.converter.convert_notebook_cells(notebook)
+            
         except Exception as e:
             return False
+    
+    
+    def _estimate_tokens(self, text: str) -> int:
+        """Function roughly estimates number of tokens in text (about 4 characters per token)"""
+        
+        return len(text) // 4 + 1
+    
+    
+    def pack_notebooks_to_budget(self, notebook_blocks: list[tuple[dict[str, Any], str]],
+                                 max_tokens: int,
+                                 count_tokens: Callable[[str], int] | None = None,
+                                 scorer: Callable[[dict[str, Any]], float] | None = None,
+                                 granularity: int = 1000) -> list[tuple[dict[str, Any], str]]:
+        """
+        Function chooses notebooks with the highest total value that fit in the token limit (0/1 knapsack)
+        Token counts are rounded up to 'max_tokens / granularity', so the chosen set never exceeds the limit
+        Notebooks that are not chosen are saved in 'skipped_notebooks'
+
+        Args:
+            notebook_blocks (list[tuple[dict[str, Any], str]]): Pairs of kernel specification and its <notebook> block
+            max_tokens (int): Number of tokens available for all blocks
+            count_tokens (Callable[[str], int] | None, optional): Function counting tokens of text. Defaults to None (rough estimate).
+            scorer (Callable[[dict[str, Any]], float] | None, optional): Function giving value of kernel. Defaults to None ('totalVotes').
+            granularity (int, optional): Number of token buckets used by the knapsack. Defaults to 1000.
 
-        return body
+        Returns:
+            list[tuple[dict[str, Any], str]]: Chosen pairs in the original order
+        """
+        
+        count_tokens = count_tokens if count_tokens is not None else self._estimate_tokens
+        scorer = scorer if scorer is not None else lambda spec: spec.get("totalVotes", 0) + 1
+        
+        self.skipped_notebooks = []
+        if max_tokens <= 0:
+            self.skipped_notebooks = [spec["slug"] for spec, _ in notebook_blocks]
+            return []
+        
+        bucket_size = max(1, -(-max_tokens // granularity))
+        capacity = max_tokens // bucket_size
+        weights = [-(-count_tokens(block) // bucket_size) for _, block in notebook_blocks]
+        values = [scorer(spec) for spec, _ in notebook_blocks]
+        
+        # best[c] - the highest value with 'c' buckets, keep[i][c] - item 'i' is used for 'c' buckets
+        best = [0.0] * (capacity + 1)
+        keep = []
+        for weight, value in zip(weights, values):
+            keep_item = [False] * (capacity + 1)
+            for c in range(capacity, weight - 1, -1):
+                if best[c - weight] + value > best[c]:
+                    best[c] = best[c - weight] + value
+                    keep_item[c] = True
+            keep.append(keep_item)
+        
+        chosen = set()
+        c = capacity
+        for i in range(len(notebook_blocks) - 1, -1, -1):
+            if keep[i][c]:
+                chosen.add(i)
+                c -= weights[i]
+        
+        self.skipped_notebooks = [spec["slug"] for i, (spec, _) in enumerate(notebook_blocks) if i not in chosen]
+        
+        return [pair for i, pair in enumerate(notebook_blocks) if i in chosen]
     
     
-    def make_notebook_generator_prompt(self, kernels_spec: list[dict[str, Any]], file_instruction: str) -> str | bool:
+    def _read_instruction(self, file_instruction: str) -> str | bool:
         """
-        Function that creates the final prompt for the LLM model
-        It combines two parts: instructions from a file and text with information from a notebook
+        Function reads instruction prompt from template directory
 
         Args:
-            kernels_spec (list[dict[str, Any]]): List of dicts with kernel specification
             file_instruction (str): Name of file with correct prompt
-            
+
         Returns:
-            str | bool: Ready prompt for LLM model
+            str | bool: Instruction prompt or bool (False) if it is missing or empty
         """
         
         try:
@@ -152,23 +371,249 @@ class DataMaker:
         if not instruction_prompt.strip():
             return False
         
-        full_notebook_prompt_structure = ""
-        for spec in kernels_spec:
-            current_file = os.path.join(PathVariable.NOTEBOOK_PATH.value, f"{spec['slug']}.ipynb")
-            if isinstance(notebook_markdown := self.convert_ipynb_to_markdown(current_file), bool):
-                return False
+        return instruction_prompt
+    
+    
+    def make_notebook_blocks(self, kernels_spec: list[dict[str, Any]], max_workers: int = 1) -> list[tuple[dict[str, Any], str]]:
+        """
+        Function converts notebooks and makes their <notebook> blocks for prompts
+        Notebooks that could not be converted are skipped and saved in 'failed_notebooks'
+        Outputs of notebooks are stripped before conversion, saved characters and tokens are in 'sanitize_reports'
+
+        Args:
+            kernels_spec (list[dict[str, Any]]): List of dicts with kernel specification
+            max_workers (int, optional): Number of processes for notebooks conversion. Defaults to 1.
+
+        Returns:
+            list[tuple[dict[str, Any], str]]: Pairs of kernel specification and its <notebook> block in order of 'kernels_spec'
+        """
+        
+        self.failed_notebooks = []
+        self.sanitize_reports = {}
+        
+        # Notebooks are converted straight from 'source' of kernels, no .ipynb files are needed
+        notebooks_markdown = self._convert_notebooks(
+            notebook_sources=[spec["source"] for spec in kernels_spec],
+            max_workers=max_workers
+        )
+        
+        notebook_blocks = []
+        for spec, (notebook_markdown, sanitize_report) in zip(kernels_spec, notebooks_markdown):
+            self.sanitize_reports[spec["slug"]] = sanitize_report
+            if isinstance(notebook_markdown, bool):
+                self.failed_notebooks.append(spec["slug"])
+                continue
             
-            full_notebook_prompt_structure += self._make_notebook_prompt_structure(
+            notebook_blocks.append((spec, self._make_notebook_prompt_structure(
                 notebook_md=notebook_markdown,
                 kernel_spec=spec
+            )))
+        
+        return notebook_blocks
+    
+    
+    def make_notebook_generator_prompt_parts(self, kernels_spec: list[dict[str, Any]], file_instruction: str,
+                                             max_workers: int = 1,
+                                             max_tokens: int | None = None,
+                                             count_tokens: Callable[[str], int] | None = None,
+                                             scorer: Callable[[dict[str, Any]], float] | None = None,
+                                             reserved_tokens: int = 0,
+                                             notebook_blocks: list[tuple[dict[str, Any], str]] | None = None) -> tuple[str, str] | bool:
+        """
+        Function that creates both parts of the prompt for the LLM model
+        The instruction from a file and the corpus with information from notebooks are returned separately,
+        so the corpus can be kept in the context cache of the model
+        Notebooks that could not be converted are skipped and saved in 'failed_notebooks'
+        Outputs of notebooks are stripped before conversion, saved characters and tokens are in 'sanitize_reports'
+        With 'max_tokens' notebooks are packed to fit the limit, the dropped ones are saved in 'skipped_notebooks'
+
+        Args:
+            kernels_spec (list[dict[str, Any]]): List of dicts with kernel specification
+            file_instruction (str): Name of file with correct prompt
+            max_workers (int, optional): Number of processes for notebooks conversion. Defaults to 1.
+            max_tokens (int | None, optional): Input token limit of the model. Defaults to None (no limit).
+            count_tokens (Callable[[str], int] | None, optional): Function counting tokens of text. Defaults to None (rough estimate).
+            scorer (Callable[[dict[str, Any]], float] | None, optional): Function giving value of kernel. Defaults to None ('totalVotes').
+            reserved_tokens (int, optional): Tokens kept free as headroom (e.g. for estimate error). Defaults to 0.
+            notebook_blocks (list[tuple[dict[str, Any], str]] | None, optional): Blocks made earlier by 'make_notebook_blocks(...)',
+                                                                                 notebooks are not converted again. Defaults to None.
+            
+        Returns:
+            tuple[str, str] | bool: Instruction and corpus of <notebook> blocks
+        """
+        
+        self.skipped_notebooks = []
+        if notebook_blocks is None:
+            self.failed_notebooks = []
+            self.sanitize_reports = {}
+        
+        if isinstance(instruction_prompt := self._read_instruction(file_instruction), bool):
+            return False
+        
+        if notebook_blocks is None:
+            notebook_blocks = self.make_notebook_blocks(kernels_spec, max_workers)
+        
+        # The instruction and the headroom are taken from the limit before packing notebooks
+        if max_tokens is not None:
+            instruction_tokens = count_tokens(instruction_prompt) if count_tokens is not None else self._estimate_tokens(instruction_prompt)
+            notebook_blocks = self.pack_notebooks_to_budget(
+                notebook_blocks=notebook_blocks,
+                max_tokens=max_tokens - instruction_tokens - reserved_tokens,
+                count_tokens=count_tokens,
+                scorer=scorer
             )
         
-        # Full prompt is: 
-        # - instruction from file
-        # - notebooks generate by function '_make_notebook_prompt_structure(...)'
-        return f"{instruction_prompt}\n{full_notebook_prompt_structure.strip()}"
+        # Blocks are joined in order of 'kernels_spec', whatever the order of conversion
+        full_notebook_prompt_structure = "".join(block for _, block in notebook_blocks)
+        if not full_notebook_prompt_structure:
+            return False
+        
+        return instruction_prompt, full_notebook_prompt_structure.strip()
+    
+    
+    def shard_notebook_blocks(self, notebook_blocks: list[tuple[dict[str, Any], str]], max_tokens: int,
+                              count_tokens: Callable[[str], int] | None = None) -> list[list[tuple[dict[str, Any], str]]]:
+        """
+        Function splits notebooks into shards which fit in the token limit, the order of notebooks is kept
+        Notebooks larger than the limit alone are saved in 'skipped_notebooks'
+
+        Args:
+            notebook_blocks (list[tuple[dict[str, Any], str]]): Pairs of kernel specification and its <notebook> block
+            max_tokens (int): Number of tokens available for blocks of one shard
+            count_tokens (Callable[[str], int] | None, optional): Function counting tokens of text. Defaults to None (rough estimate).
+
+        Returns:
+            list[list[tuple[dict[str, Any], str]]]: Shards of pairs
+        """
+        
+        count_tokens = count_tokens if count_tokens is not None else self._estimate_tokens
+        
+        self.skipped_notebooks = []
+        shards = []
+        shard, shard_tokens = [], 0
+        for spec, block in notebook_blocks:
+            if (block_tokens := count_tokens(block)) > max_tokens:
+                self.skipped_notebooks.append(spec["slug"])
+                continue
+            
+            if shard and shard_tokens + block_tokens > max_tokens:
+                shards.append(shard)
+                shard, shard_tokens = [], 0
+            
+            shard.append((spec, block))
+            shard_tokens += block_tokens
+        
+        if shard:
+            shards.append(shard)
+        
+        return shards
+    
+    
+    def make_map_reduce_prompts(self, kernels_spec: list[dict[str, Any]], file_instruction: str,
+                                summary_instruction: str, max_tokens: int,
+                                max_workers: int = 1,
+                                count_tokens: Callable[[str], int] | None = None,
+                                reserved_tokens: int = 0,
+                                notebook_blocks: list[tuple[dict[str, Any], str]] | None = None) -> list[str] | bool:
+        """
+        Function creates prompts of the map stage of long-context mode
+        All notebooks are used, they are split into shards and every shard gets its own summary prompt
+
+        Args:
+            kernels_spec (list[dict[str, Any]]): List of dicts with kernel specification
+            file_instruction (str): Name of file with prompt of generation, only checked here
+            summary_instruction (str): Name of file with prompt of summarizing notebooks
+            max_tokens (int): Token limit of one summary prompt (at most the input token limit of the model)
+            max_workers (int, optional): Number of processes for notebooks conversion. Defaults to 1.
+            count_tokens (Callable[[str], int] | None, optional): Function counting tokens of text. Defaults to None (rough estimate).
+            reserved_tokens (int, optional): Tokens kept free as headroom (e.g. for estimate error). Defaults to 0.
+            notebook_blocks (list[tuple[dict[str, Any], str]] | None, optional): Blocks made earlier by 'make_notebook_blocks(...)',
+                                                                                 notebooks are not converted again. Defaults to None.
+
+        Returns:
+            list[str] | bool: Summary prompts, one for each shard
+        """
+        
+        self.skipped_notebooks = []
+        if notebook_blocks is None:
+            self.failed_notebooks = []
+            self.sanitize_reports = {}
+        
+        # Prompt of the reduce stage is checked now, so no summaries are paid for if it is missing
+        if isinstance(self._read_instruction(file_instruction), bool):
+            return False
+        
+        if isinstance(instruction_prompt := self._read_instruction(summary_instruction), bool):
+            return False
+        
+        if notebook_blocks is None:
+            notebook_blocks = self.make_notebook_blocks(kernels_spec, max_workers)
+        
+        count_tokens = count_tokens if count_tokens is not None else self._estimate_tokens
+        shards = self.shard_notebook_blocks(
+            notebook_blocks=notebook_blocks,
+            max_tokens=max_tokens - count_tokens(instruction_prompt) - reserved_tokens,
+            count_tokens=count_tokens
+        )
+        if not shards:
+            return False
+        
+        return [f"{instruction_prompt}\n{''.join(block for _, block in shard).strip()}" for shard in shards]
+    
+    
+    def make_digest_generator_prompt(self, digests: list[str], file_instruction: str) -> str | bool:
+        """
+        Function creates the prompt of the reduce stage of long-context mode
+        Digests of shards are passed in <notebook> tags instead of full notebooks
+
+        Args:
+            digests (list[str]): Summaries of shards made by the model
+            file_instruction (str): Name of file with correct prompt
+
+        Returns:
+            str | bool: Ready prompt for LLM model
+        """
+        
+        if isinstance(instruction_prompt := self._read_instruction(file_instruction), bool):
+            return False
+        
+        if not (digests := [digest.strip() for digest in digests if digest and digest.strip()]):
+            return False
+        
+        digests_prompt_structure = "".join(
+            f"\n<notebook>\n<digest>\n{digest}\n</digest>\n</notebook>\n" for digest in digests
+        )
+        
+        return f"{instruction_prompt}\n{digests_prompt_structure.strip()}"
        
     
+    def format_generated_section(self, section_data: dict[str, Any]) -> str:
+        """
+        Function returns formatted md string for one section of generated notebook
+        It is also used to show sections while the notebook is streamed
+
+        Args:
+            section_data (dict[str, Any]): Section from 'sections' of generated notebook
+
+        Returns:
+            str: Section in Markdown format
+        """
+        
+        section_data_text = f"### {section_data.get('name')}\n\n"
+        section_data_text += f"✏️ {section_data.get('description')}\n\n"
+        
+        if section_data.get('code'):
+            section_data_text += f"```python\n{section_data.get('code')}\n```\n\n"
+            
+        if section_data.get('explanation'):
+            section_data_text += f"📖 {section_data.get('explanation')}\n\n"
+                
+        for val in section_data.get("alternatives_considered", []):
+            section_data_text += f"🔄 {val}\n\n"
+        
+        return section_data_text
+    
+    
     def format_generated_notebook(self, generated_notebook_data: dict[str, Any], template: str) -> str:
         """
         Function returns formatted md string for generated notebook
@@ -184,17 +629,7 @@ class DataMaker:
         # Concat 'Section' from generated notebook in JSON format
         section_data_text = ""
         for section_data in generated_notebook_data.get("sections", []):
-            section_data_text += f"### {section_data.get('name')}\n\n"
-            section_data_text += f"✏️ {section_data.get('description')}\n\n"
-            
-            if section_data.get('code'):
-                section_data_text += f"```python\n{section_data.get('code')}\n```\n\n"
-                
-            if section_data.get('explanation'):
-                section_data_text += f"📖 {section_data.get('explanation')}\n\n"
-                    
-            for val in section_data.get("alternatives_considered", []):
-                section_data_text += f"🔄 {val}\n\n"
+            section_data_text += self.format_generated_section(section_data)
         
         # Concat 'Implemented' from generated notebook in JSON format
         implemented_data_text = "### ⚙️ Optimizations\n\n"
@@ -252,23 +687,25 @@ class DataMaker:
             except Exception:
                 return float("inf")
 
-        max_file_number = sorted(
-            os.listdir(PathVariable.SAVE_PATH.value),
-            key=lambda x: sort_files(x),
-            reverse=True
-        )
-        max_file_number = max_file_number[0].split("-")[0] if max_file_number else 0
+        # Background jobs save at the same time, so the number of file is taken under the lock
+        with _save_lock:
+            max_file_number = sorted(
+                os.listdir(PathVariable.SAVE_PATH.value),
+                key=lambda x: sort_files(x),
+                reverse=True
+            )
+            max_file_number = max_file_number[0].split("-")[0] if max_file_number else 0
 
-        try:
-            with open(
-                file=os.path.join(PathVariable.SAVE_PATH.value, f"{int(max_file_number) + 1}-{"-".join(name.split(" "))}-{datetime.now().date()}.md"), 
-                mode="w",
-                encoding="utf-8"
-            ) as f:
-                f.write(markdown_text)
+            try:
+                with open(
+                    file=os.path.join(PathVariable.SAVE_PATH.value, f"{int(max_file_number) + 1}-{"-".join(name.split(" "))}-{datetime.now().date()}.md"), 
+                    mode="w",
+                    encoding="utf-8"
+                ) as f:
+                    f.write(markdown_text)
 
-        except Exception as e:
-            return False
+            except Exception as e:
+                return False
         
         return True
     
@@ -0,0 +1,143 @@
+from typing import Any
+import threading
+import json
+import os
+
+
+# Eviction removes entries until the cache takes this part of 'max_bytes', so the next writes do not evict again
+EVICTION_TARGET_RATIO = 0.9
+
+
+
+class DiskCache:
+
+    # Sizes of cache directories are shared by all objects in the process, sessions create their own caches over them
+    _total_bytes = {}
+    _size_lock = threading.Lock()
+
+    def __init__(self, cache_dir: str, max_bytes: int) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+    
+    
+    def get(self, key: str) -> dict[str, Any] | None:
+        """
+        Function returns cached value
+        Reading an entry marks it as recently used
+
+        Args:
+            key (str): Key of the entry (used as file name)
+
+        Returns:
+            dict[str, Any] | None: Cached value or None if it is not cached
+        """
+        
+        entry_path = os.path.join(self.cache_dir, f"{key}.json")
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(entry_path)
+            
+        except Exception as e:
+            with self._lock:
+                self.misses += 1
+            return None
+        
+        with self._lock:
+            self.hits += 1
+        
+        return value
+    
+    
+    def put(self, key: str, value: dict[str, Any]) -> None:
+        """
+        Function saves value and evicts least recently used entries over the limit
+        The size of the cache is kept in memory, the directory is scanned only the first time and when over the limit
+
+        Args:
+            key (str): Key of the entry (used as file name)
+            value (dict[str, Any]): Value to save, it must be JSON serializable
+        """
+        
+        entry_path = os.path.join(self.cache_dir, f"{key}.json")
+        tmp_path = f"{entry_path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            new_size = os.path.getsize(tmp_path)
+            old_size = os.path.getsize(entry_path) if os.path.exists(entry_path) else 0
+            os.replace(tmp_path, entry_path)
+            
+        except Exception as e:
+            return
+        
+        with DiskCache._size_lock:
+            if (total_size := DiskCache._total_bytes.get(self.cache_dir)) is None:
+                total_size = self._scan_size()
+            else:
+                total_size += new_size - old_size
+            
+            if total_size > self.max_bytes:
+                total_size = self._evict()
+            DiskCache._total_bytes[self.cache_dir] = total_size
+    
+    
+    def _list_entries(self) -> list[tuple[float, int, str]]:
+        """Function returns time of last use, size and path of every entry"""
+        
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".json"):
+                entry_stat = entry.stat()
+                entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+        
+        return entries
+    
+    
+    def _scan_size(self) -> int:
+        """Function returns size of all entries read from the directory"""
+        
+        return sum(size for _, size, _ in self._list_entries())
+    
+    
+    def _evict(self) -> int:
+        """
+        Function removes the oldest used entries until the cache fits in 'EVICTION_TARGET_RATIO' of 'max_bytes'
+
+        Returns:
+            int: Size of the cache after eviction
+        """
+        
+        entries = self._list_entries()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes * EVICTION_TARGET_RATIO:
+                break
+            
+            try:
+                os.remove(path)
+                total_size -= size
+                
+            except Exception as e:
+                continue
+        
+        return total_size
+    
+    
+    def get_stats(self) -> dict[str, int]:
+        """
+        Function returns counters of the cache
+
+        Returns:
+            dict[str, int]: Number of hits and misses
+        """
+        
+        return {
+            "hits"   : self.hits,
+            "misses" : self.misses
+        }
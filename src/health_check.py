@@ -0,0 +1,85 @@
+from typing import Any, Callable
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import hashlib
+import time
+
+
+
+class HealthCheckService:
+
+    def __init__(self, ttl: float = 300.0, max_workers: int = 2) -> None:
+        self.ttl = ttl
+        self._results = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="health-check")
+
+
+    def get_status(self, name: str, credentials: str, probe: Callable[[], Any]) -> bool | None:
+        """
+        Function returns the last known status of the service without waiting for the probe
+        If there is no result or it is older than 'ttl', the probe is started in the background.
+        An expired result is still returned while the new one is checked.
+
+        Args:
+            name (str): Name of the checked service (e.g. "kaggle")
+            credentials (str): Credentials used by the probe, results are kept per credentials (as a hash)
+            probe (Callable[[], Any]): Function that raises an exception if the service does not work
+
+        Returns:
+            bool | None: True if the service works, False if not, None if it was not checked yet
+        """
+
+        check_key = (name, hashlib.sha256(credentials.encode("utf-8")).hexdigest())
+        with self._lock:
+            result = self._results.get(check_key)
+            is_expired = result is None or time.monotonic() - result["checked_at"] > self.ttl
+
+            if is_expired and check_key not in self._in_flight:
+                self._in_flight.add(check_key)
+                self._executor.submit(self._run_probe, check_key, probe)
+
+        return result["works"] if result is not None else None
+
+
+    def invalidate(self, name: str, credentials: str) -> None:
+        """
+        Function removes the result, so the next 'get_status(...)' checks the service again
+
+        Args:
+            name (str): Name of the checked service
+            credentials (str): Credentials used by the probe
+        """
+
+        with self._lock:
+            self._results.pop((name, hashlib.sha256(credentials.encode("utf-8")).hexdigest()), None)
+
+
+    def _run_probe(self, check_key: tuple[str, str], probe: Callable[[], Any]) -> None:
+        """
+        Function runs the probe in a worker thread and saves its result
+
+        Args:
+            check_key (tuple[str, str]): Name of the service and hash of credentials
+            probe (Callable[[], Any]): Function that raises an exception if the service does not work
+        """
+
+        try:
+            probe()
+            works = True
+
+        except Exception as e:
+            works = False
+
+        with self._lock:
+            self._results[check_key] = {
+                "works"      : works,
+                "checked_at" : time.monotonic()
+            }
+            self._in_flight.discard(check_key)
+
+
+
+# Service shared by all Streamlit sessions of the process
+health_checks = HealthCheckService()
@@ -0,0 +1,159 @@
+from typing import Any, Callable
+from config import JOB_RUNNER_MAX_WORKERS
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import threading
+import uuid
+import time
+
+
+
+class Job:
+
+    def __init__(self, job_id: str, name: str) -> None:
+        self.job_id = job_id
+        self.name = name
+        self.status = "queued"
+        self.stage = "Queued"
+        self.progress = 0.0
+        self.messages = []
+        self.sections = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+
+    def update(self, stage: str, progress: float) -> None:
+        """
+        Function saves the current stage of the job
+
+        Args:
+            stage (str): Description of the stage shown to the user
+            progress (float): Progress of the whole job from 0.0 to 1.0
+        """
+
+        self.stage = stage
+        self.progress = min(max(progress, 0.0), 1.0)
+
+
+    def add_message(self, level: str, text: str) -> None:
+        """
+        Function adds message shown next to the job
+
+        Args:
+            level (str): Level of message - "info", "warning" or "caption"
+            text (str): Text of message
+        """
+
+        self.messages.append((level, text))
+
+
+    def fail(self, error: str) -> None:
+        """
+        Function ends the job with an error
+
+        Args:
+            error (str): Error shown to the user
+        """
+
+        self.error = error
+        self.status = "failed"
+        self.finished_at = time.time()
+
+
+    def is_finished(self) -> bool:
+        """Function returns True if the job is done or failed"""
+
+        return self.status in ("done", "failed")
+
+
+
+class JobRunner:
+
+    def __init__(self, max_workers: int = 4, max_jobs: int = 100) -> None:
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="notebook-job")
+
+
+    def submit(self, name: str, function: Callable[..., Any], *args, key: str | None = None) -> str:
+        """
+        Function queues the job in the worker pool
+        The function gets 'Job' as the first argument and reports progress through it.
+        If a job with the same 'key' is queued or running, its ID is returned and no new job is started,
+        so identical requests of different sessions share one computation and its result.
+
+        Args:
+            name (str): Name of the job shown to the user
+            function (Callable[..., Any]): Function doing the work
+            *args: Next arguments of the function
+            key (str | None, optional): Key of identical requests. Defaults to None (never shared).
+
+        Returns:
+            str: ID of the job
+        """
+
+        with self._lock:
+            if key is not None and key in self._in_flight:
+                return self._in_flight[key]
+
+            job = Job(uuid.uuid4().hex[:12], name)
+            self._jobs[job.job_id] = job
+            if key is not None:
+                self._in_flight[key] = job.job_id
+
+            # The oldest finished jobs are forgotten, their results stay in the save directory
+            while len(self._jobs) > self.max_jobs:
+                oldest_id = next((job_id for job_id, old_job in self._jobs.items() if old_job.is_finished()), None)
+                if oldest_id is None:
+                    break
+                del self._jobs[oldest_id]
+
+        self._executor.submit(self._run, job, function, args, key)
+
+        return job.job_id
+
+
+    def _run(self, job: Job, function: Callable[..., Any], args: tuple, key: str | None = None) -> None:
+        """Function runs the job in a worker thread, unexpected errors end the job as failed"""
+
+        job.status = "running"
+        try:
+            function(job, *args)
+
+            if not job.is_finished():
+                job.status = "done"
+                job.finished_at = time.time()
+                job.update("Done", 1.0)
+
+        except Exception as e:
+            job.fail(f"Unexpected Error: {e}")
+
+        finally:
+            # Next identical request starts a new job, the result of this one is already saved
+            with self._lock:
+                if key is not None and self._in_flight.get(key) == job.job_id:
+                    del self._in_flight[key]
+
+
+    def get_job(self, job_id: str) -> Job | None:
+        """
+        Function returns the job with given ID
+
+        Args:
+            job_id (str): ID of the job
+
+        Returns:
+            Job | None: Job or None if it does not exist
+        """
+
+        with self._lock:
+            return self._jobs.get(job_id)
+
+
+
+# Worker pool shared by all Streamlit sessions of the process
+job_runner = JobRunner(max_workers=JOB_RUNNER_MAX_WORKERS)
@@ -1,12 +1,49 @@
-from typing import Any
+from typing import Any, Iterable, Iterator
+from config import PathVariable, KERNEL_CACHE_MAX_BYTES
+from disk_cache import DiskCache
+from clients import client_registry
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import kaggle
+import os
+
+
+
+class KernelCache(DiskCache):
+    
+    def make_key(self, kernel: Any) -> str:
+        """
+        Function makes a cache key from the kernel ref and its version metadata
+        A new version or a new run of the kernel gives a new key
+
+        Args:
+            kernel (Any): Kernel from 'kernels_list' response
+
+        Returns:
+            str: Hash used as name of the cache entry
+        """
+        
+        version = getattr(kernel, "currentVersionNumber", None) or getattr(kernel, "versionNumber", None)
+        last_run_time = getattr(kernel, "lastRunTime", None)
+        
+        return hashlib.sha256(f"{kernel.ref}|{version}|{last_run_time}".encode("utf-8")).hexdigest()
 
 
 
 class MyKaggleApi:
 
-    def __init__(self) -> None:
-        pass
+    def __init__(self, kernel_cache: KernelCache | None = None) -> None:
+        self.failed_kernels = []
+        self.kernel_cache = kernel_cache if kernel_cache is not None else KernelCache(
+            cache_dir=os.path.join(PathVariable.CACHE_PATH.value, "kernels"),
+            max_bytes=KERNEL_CACHE_MAX_BYTES
+        )
+    
+    
+    def connect(self) -> None:
+        """Borrow authenticated Kaggle API from the shared registry, it is reused by all sessions of the process"""
+        
+        self.api = client_registry.get_kaggle_api()
     
     
     def load_api(self, api: kaggle.KaggleApi) -> None:
@@ -58,41 +95,121 @@ class MyKaggleApi:
         return kernels_name_list
     
 
-    def get_kernels_specification(self, kernels: list) -> list[dict[str, Any]]:
+    def iter_kernels(self, competition: str | None = None,
+                     dataset: str | None = None,
+                     total: int | None = None,
+                     **kwargs) -> Iterator[Any]:
+        """
+        Generator that yields kernels (notebooks) across following pages of 'kernels_list'
+        The next page is fetched in the background while the current one is consumed
+        It stops after 'total' kernels or at an empty page
+
+        Args:
+            competition (str | None, optional): Name of the competition from which to download notebooks. Defaults to None.
+            dataset (str | None, optional): Name of the dataset from which to download notebooks. Defaults to None.
+            total (int | None, optional): Maximum number of kernels to yield. Defaults to None (all pages).
+
+        Yields:
+            Iterator[Any]: Kernels from api responses
+        """
+        
+        page = kwargs.pop("page", 1)
+        page_size = kwargs.get("page_size", 20)
+        yielded_kernels = 0
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_page = executor.submit(self.get_kernels_list, competition, dataset, page=page, **kwargs)
+            
+            while next_page is not None:
+                kernels_page = next_page.result()
+                if len(kernels_page) == 0:
+                    break
+                
+                # Prefetch only if the next page can still be used
+                next_page = None
+                has_next_page = len(kernels_page) >= page_size
+                if has_next_page and (total is None or yielded_kernels + len(kernels_page) < total):
+                    page += 1
+                    next_page = executor.submit(self.get_kernels_list, competition, dataset, page=page, **kwargs)
+                
+                for kernel in kernels_page:
+                    if total is not None and yielded_kernels >= total:
+                        return
+                    
+                    yield kernel
+                    yielded_kernels += 1
+
+
+    def _pull_kernel_specification(self, kernel: Any) -> dict[str, Any]:
+        """
+        Function to pull a single kernel and build its specification
+        Specification is read from the kernel cache if the kernel has not changed
+
+        Args:
+            kernel (Any): Kernel from 'kernels_list' response
+
+        Returns:
+            dict[str, Any]: Dict with the name of the kernel specification and the value of this specification
+        """
+        
+        cache_key = self.kernel_cache.make_key(kernel)
+        if (kernel_spec := self.kernel_cache.get(cache_key)) is not None:
+            return kernel_spec
+        
+        kernel_name = kernel.ref # type: ignore
+        
+        user_name = kernel_name.split("/")[0]
+        notebook_name = kernel_name.split("/")[1]
+        
+        request_kernel = self.api.kernel_pull(user_name=user_name, kernel_slug=notebook_name)
+        kernel_spec = {
+            "author"                 : request_kernel["metadata"]["author"],
+            "categoryIds"            : request_kernel["metadata"]["categoryIds"],
+            "competitionDataSources" : request_kernel["metadata"]["competitionDataSources"],
+            "datasetDataSources"     : request_kernel["metadata"]["datasetDataSources"],
+            "language"               : request_kernel["metadata"]["language"],
+            "title"                  : request_kernel["metadata"]["title"],
+            "slug"                   : request_kernel["metadata"]["slug"],
+            "link"                   : f"https://www.kaggle.com/code/{kernel_name}",
+            "totalVotes"             : request_kernel["metadata"]["totalVotes"],
+            "source"                 : request_kernel["blob"]["source"],
+        }
+        self.kernel_cache.put(cache_key, kernel_spec)
+        
+        return kernel_spec
+    
+
+    def get_kernels_specification(self, kernels: Iterable, max_workers: int = 1) -> list[dict[str, Any]]:
         """
         Function to get specification of each kernel
+        With 'max_workers' greater than 1 kernels are pulled concurrently, the order of 'kernels' is kept
+        Kernels can be a generator (e.g. 'iter_kernels(...)'), pulling starts as soon as a kernel is received
+        Kernels that could not be pulled are skipped and saved in 'failed_kernels'
 
         Args:
-            kernels (list): List with kernels
+            kernels (Iterable): List or iterator with kernels
+            max_workers (int, optional): Number of concurrent requests to the API. Defaults to 1.
 
         Returns:
             list[dict[str, Any]]: List with dicts of the name of the kernel specification and the value of this specification
         """
-        assert len(kernels) > 0, "No kernels to use"
+        assert max_workers > 0, "Number of workers must be positive"
         
+        self.failed_kernels = []
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            kernels_futures = [(kernel, executor.submit(self._pull_kernel_specification, kernel)) for kernel in kernels]
+        
+        # Results are read in submission order, so the list matches 'kernels'
         kernels_spec_list = []
-        for kernel in kernels:
-            kernel_name = kernel.ref # type: ignore
-            
-            user_name = kernel_name.split("/")[0]
-            notebook_name = kernel_name.split("/")[1]
-            
+        for kernel, future in kernels_futures:
             try:
-                request_kernel = self.api.kernel_pull(user_name=user_name, kernel_slug=notebook_name) 
-                kernels_spec_list.append({
-                    "author"                 : request_kernel["metadata"]["author"],
-                    "categoryIds"            : request_kernel["metadata"]["categoryIds"],
-                    "competitionDataSources" : request_kernel["metadata"]["competitionDataSources"],
-                    "datasetDataSources"     : request_kernel["metadata"]["datasetDataSources"],
-                    "language"               : request_kernel["metadata"]["language"],
-                    "title"                  : request_kernel["metadata"]["title"],
-                    "slug"                   : request_kernel["metadata"]["slug"],
-                    "link"                   : f"https://www.kaggle.com/code/{kernel_name}",
-                    "totalVotes"             : request_kernel["metadata"]["totalVotes"],
-                    "source"                 : request_kernel["blob"]["source"],
-                })
+                kernels_spec_list.append(future.result())
     
             except Exception as e:
-                return []
+                self.failed_kernels.append({
+                    "ref"   : getattr(kernel, "ref", str(kernel)),
+                    "error" : str(e)
+                })
                 
         return kernels_spec_list
\ No newline at end of file
@@ -1,29 +1,249 @@
-from typing import Any
-from google import genai
+from typing import Any, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import PathVariable, RESPONSE_CACHE_MAX_BYTES, CONTEXT_CACHE_SETTINGS, CHAT_HISTORY_SETTINGS
+from disk_cache import DiskCache
+from clients import client_registry
 from google.genai import types
+from collections import OrderedDict
+import threading
+import hashlib
+import random
+import time
 import json
+import os
+import re
 from json_repair import repair_json
 
 
+# Starting ratio of characters per token, it is calibrated by exact counts from the API
+DEFAULT_CHARS_PER_TOKEN = 4.0
+
+# Weight of a new exact count in the calibrated ratio
+CALIBRATION_WEIGHT = 0.3
+
+# Number of notebook blocks counted exactly to calibrate the estimate before packing
+CALIBRATION_SAMPLE_SIZE = 5
+
+# Number of exact token counts kept in memory
+TOKEN_COUNT_CACHE_SIZE = 1024
+
+# Time after which the list of models is fetched again (in seconds)
+MODEL_CATALOG_TTL = 3600
+
+# Message of the API when cached content has expired or has been removed
+CONTEXT_CACHE_ERROR_PATTERN = re.compile(r"cache[ds]?[ _]?content.*not found|not found.*cache", re.IGNORECASE)
+
+# Schema of generated notebook passed to the model in structured output mode
+NOTEBOOK_RESPONSE_SCHEMA = {
+    "type" : "OBJECT",
+    "properties" : {
+        "new_notebook" : {
+            "type" : "OBJECT",
+            "properties" : {
+                "title" : {"type" : "STRING"},
+                "sections" : {
+                    "type" : "ARRAY",
+                    "items" : {
+                        "type" : "OBJECT",
+                        "properties" : {
+                            "name" :                    {"type" : "STRING"},
+                            "description" :             {"type" : "STRING"},
+                            "code" :                    {"type" : "STRING"},
+                            "explanation" :             {"type" : "STRING"},
+                            "alternatives_considered" : {"type" : "ARRAY", "items" : {"type" : "STRING"}},
+                        },
+                        "required" : ["name", "description", "code", "explanation"],
+                        "propertyOrdering" : ["name", "description", "code", "explanation", "alternatives_considered"],
+                    },
+                },
+                "optimizations" : {
+                    "type" : "OBJECT",
+                    "properties" : {
+                        "implemented" : {"type" : "ARRAY", "items" : {"type" : "STRING"}},
+                        "future" :      {"type" : "ARRAY", "items" : {"type" : "STRING"}},
+                    },
+                    "required" : ["implemented", "future"],
+                },
+                "lessons_learned" : {"type" : "ARRAY", "items" : {"type" : "STRING"}},
+            },
+            "required" : ["title", "sections", "optimizations", "lessons_learned"],
+            "propertyOrdering" : ["title", "sections", "optimizations", "lessons_learned"],
+        },
+    },
+    "required" : ["new_notebook"],
+}
+
+
+class RetryPolicy:
+    
+    def __init__(self, max_attempts: int = 3, base_delay: float = 1.0, max_delay: float = 30.0, deadline: float = 600.0) -> None:
+        assert max_attempts > 0, "Number of attempts must be positive"
+        
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+    
+    
+    def get_delay(self, attempt: int) -> float:
+        """
+        Function returns waiting time before next attempt - exponential backoff with full jitter
+
+        Args:
+            attempt (int): Number of failed attempts so far (from 1)
+
+        Returns:
+            float: Delay in seconds
+        """
+        
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class SectionStreamParser:
+    
+    def __init__(self) -> None:
+        self.buffer = ""
+        self.position = None
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.section_start = 0
+        self.finished = False
+    
+    
+    def feed(self, chunk: str) -> list[dict[str, Any]]:
+        """
+        Function adds next part of streamed JSON and returns 'sections' entries completed by it
+        Only new characters are scanned, so the whole stream is read once
+
+        Args:
+            chunk (str): Next part of the model response
+
+        Returns:
+            list[dict[str, Any]]: Sections completed in this part
+        """
+        
+        self.buffer += chunk
+        if self.position is None:
+            if (match := re.search(r'"sections"\s*:\s*\[', self.buffer)) is None:
+                return []
+            self.position = match.end()
+        
+        completed_sections = []
+        while self.position < len(self.buffer) and not self.finished:
+            char = self.buffer[self.position]
+            
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            
+            elif char == '"':
+                self.in_string = True
+            
+            elif char == "{":
+                if self.depth == 0:
+                    self.section_start = self.position
+                self.depth += 1
+            
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    section_text = self.buffer[self.section_start : self.position + 1]
+                    try:
+                        completed_sections.append(json.loads(repair_json(section_text)))
+                    except Exception as e:
+                        pass
+            
+            elif char == "]" and self.depth == 0:
+                self.finished = True
+            
+            self.position += 1
+        
+        return completed_sections
+
+
 class LLM:
     
+    # Shared by all objects in the process, Streamlit creates new objects on reruns
+    _token_count_cache = OrderedDict()
+    _chars_per_token = {}
+    _token_lock = threading.Lock()
+    _model_catalogs = {}
+    _catalog_lock = threading.Lock()
+    _context_caches = {}
+    _context_create_locks = {}
+    _context_lock = threading.Lock()
+    _summary_executor = ThreadPoolExecutor(max_workers=CHAT_HISTORY_SETTINGS["summary_max_workers"], thread_name_prefix="chat-summary")
+    
     def __init__(self) -> None:
         self.is_connected = None
         self.is_chat_started = None
+        self.response_cache = DiskCache(
+            cache_dir=os.path.join(PathVariable.CACHE_PATH.value, "responses"),
+            max_bytes=RESPONSE_CACHE_MAX_BYTES
+        )
     
     
     def connect_client(self, api_key: str) -> None:
         """
-        Create a client object with the specified API Key
+        Borrow a client object for the specified API Key from the shared registry
+        The client (and its HTTP connections) is reused by all sessions of the process
 
         Args:
             api_key (str): API Key from Google AI Studio
         """
 
-        self.client = genai.Client(api_key=api_key)
+        self.client = client_registry.get_gemini_client(api_key)
+        self.credential_key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
         self.is_connected = True
 
     
+    def get_model_catalog(self, refresh: bool = False) -> dict[str, dict[str, Any]]:
+        """
+        Get catalog of models indexed by model name
+        The catalog is shared in the process for the same API Key and listed again after 'MODEL_CATALOG_TTL'
+
+        Args:
+            refresh (bool, optional): List models from the API even if the catalog is fresh. Defaults to False.
+
+        Returns:
+            dict[str, dict[str, Any]]: Token limits and supported actions of each model
+        """
+        assert self.is_connected is True, "First, connect to the API"
+        
+        with LLM._catalog_lock:
+            cached_catalog = LLM._model_catalogs.get(self.credential_key)
+            if not refresh and cached_catalog is not None and time.monotonic() - cached_catalog["fetched_at"] < MODEL_CATALOG_TTL:
+                return cached_catalog["models"]
+        
+        model_catalog = {
+            model.name : {
+                "input_token_limit"  : model.input_token_limit,
+                "output_token_limit" : model.output_token_limit,
+                "supported_actions"  : list(model.supported_actions or []),
+            }
+            for model in self.client.models.list()
+        }
+        
+        with LLM._catalog_lock:
+            LLM._model_catalogs[self.credential_key] = {
+                "fetched_at" : time.monotonic(),
+                "models"     : model_catalog
+            }
+        
+        return model_catalog
+    
+    
+    def refresh_model_catalog(self) -> None:
+        """List models from the API again and replace the cached catalog"""
+        
+        self.get_model_catalog(refresh=True)
+
+
     def get_models_list(self) -> list[str | None]:
         """
         Get models from the API that have 'generateContent' and 'countTokens' functions
@@ -34,9 +254,9 @@ class LLM:
         assert self.is_connected is True, "First, connect to the API"
         
         return [
-            model.name
-            for model in self.client.models.list()
-            if "generateContent" in model.supported_actions and "countTokens" in model.supported_actions # type: ignore
+            model_name
+            for model_name, model_data in self.get_model_catalog().items()
+            if "generateContent" in model_data["supported_actions"] and "countTokens" in model_data["supported_actions"]
         ]
 
 
@@ -53,33 +273,278 @@ class LLM:
         """
         assert self.is_connected is True, "First, connect to the API"
 
-        for model in list(self.client.models.list()):
-
-            model_dict_data = model.__dict__
-            if model_dict_data["name"] == model_name:
-                return {
-                    "max_input_tokens" : model_dict_data["input_token_limit"],
-                    "max_output_tokens" : model_dict_data["output_token_limit"]
-                }
+        if (model_data := self.get_model_catalog().get(model_name)) is None:
+            return None
+        
+        return {
+            "max_input_tokens" : model_data["input_token_limit"],
+            "max_output_tokens" : model_data["output_token_limit"]
+        }
             
 
-    def count_tokens(self, model_name, prompt: str) -> int:
+    def estimate_tokens(self, model_name, prompt: str) -> int:
+        """
+        Estimate tokens in a given prompt locally, without calling the API
+        It uses a characters per token ratio calibrated by previous exact counts of the model
+
+        Args:
+            model_name (...): Name of selected model
+            prompt (str): Prompt to count tokens
+
+        Returns:
+            int: Estimated number of tokens
+        """
+        
+        chars_per_token = LLM._chars_per_token.get(model_name, DEFAULT_CHARS_PER_TOKEN)
+        
+        return int(len(prompt) / chars_per_token) + 1
+    
+    
+    def _calibrate_estimator(self, model_name, prompt: str, total_tokens: int) -> None:
+        """
+        Update characters per token ratio of the model with an exact count
+
+        Args:
+            model_name (...): Name of selected model
+            prompt (str): Counted prompt
+            total_tokens (int): Exact number of tokens from the API
+        """
+        
+        if total_tokens <= 0 or not prompt:
+            return
+        
+        observed_ratio = len(prompt) / total_tokens
+        with LLM._token_lock:
+            if (current_ratio := LLM._chars_per_token.get(model_name)) is None:
+                LLM._chars_per_token[model_name] = observed_ratio
+            else:
+                LLM._chars_per_token[model_name] = (1 - CALIBRATION_WEIGHT) * current_ratio + CALIBRATION_WEIGHT * observed_ratio
+    
+    
+    def calibrate_estimator(self, model_name, texts: list[str], sample_size: int = CALIBRATION_SAMPLE_SIZE) -> None:
+        """
+        Set characters per token ratio of the model from an exact count of a sample of texts
+        Texts are sampled evenly from the longest to the shortest and counted in one request,
+        the count is cached by hash like in 'count_tokens(...)', so the same texts are not sent again
+
+        Args:
+            model_name (...): Name of selected model
+            texts (list[str]): Texts of the prompt (e.g. instruction and <notebook> blocks)
+            sample_size (int, optional): Number of texts in the sample. Defaults to 'CALIBRATION_SAMPLE_SIZE'.
+        """
+        
+        if not (texts := sorted((text for text in texts if text), key=len, reverse=True)):
+            return
+        
+        step = max(1, len(texts) // sample_size)
+        sample_text = "".join(texts[::step][:sample_size])
+        if (total_tokens := self.count_tokens(model_name, sample_text)) <= 0:
+            return
+        
+        # Sample of this prompt is a better guess than the average of earlier prompts
+        with LLM._token_lock:
+            LLM._chars_per_token[model_name] = len(sample_text) / total_tokens
+    
+    
+    def count_tokens(self, model_name, prompt: str, limit: int | None = None, margin: float = 0.15) -> int:
         """
         Count tokens in a given prompt according to the selected model
+        Exact counts are cached by hash of the prompt and model name
+        With 'limit' the API is called only if the local estimate is close to the limit
 
         Args:
             model_name (...): Name of selected model
             prompt (str): Prompt to count tokens
+            limit (int | None, optional): Token limit to compare with. Defaults to None (always exact count).
+            margin (float, optional): Relative distance from the limit that needs exact count. Defaults to 0.15.
 
         Returns:
             int | None: Number of tokens from a given prompt
         """
         assert self.is_connected is True, "First, connect to the API"
 
-        return self.client.models.count_tokens(
+        cache_key = (hashlib.sha256(prompt.encode("utf-8")).hexdigest(), model_name)
+        with LLM._token_lock:
+            if (total_tokens := LLM._token_count_cache.get(cache_key)) is not None:
+                LLM._token_count_cache.move_to_end(cache_key)
+                return total_tokens
+        
+        # Estimate far from the limit is enough to decide, the prompt is not sent
+        if limit is not None:
+            estimated_tokens = self.estimate_tokens(model_name, prompt)
+            if abs(estimated_tokens - limit) > limit * margin:
+                return estimated_tokens
+
+        total_tokens = self.client.models.count_tokens(
             model=model_name,
             contents=prompt,
         ).total_tokens # type: ignore
+        
+        self._calibrate_estimator(model_name, prompt, total_tokens) # type: ignore
+        with LLM._token_lock:
+            LLM._token_count_cache[cache_key] = total_tokens
+            if len(LLM._token_count_cache) > TOKEN_COUNT_CACHE_SIZE:
+                LLM._token_count_cache.popitem(last=False)
+        
+        return total_tokens # type: ignore
+    
+    
+    def get_context_cache(self, model_name, corpus: str) -> str | None:
+        """
+        Function returns name of the context cache with 'corpus' for the model, the cache is created if needed
+        Caches are shared in the process for the same API Key, so reruns with other parameters
+        and chat sessions over the same notebooks do not upload and pay for the corpus again.
+        Small corpora (below 'min_tokens') and errors of the API give None, the corpus is then sent normally.
+
+        Args:
+            model_name (...): Name of selected model
+            corpus (str): Large part of the prompt repeated between requests (e.g. <notebook> blocks)
+
+        Returns:
+            str | None: Name of cached content or None if it is not used
+        """
+        assert self.is_connected is True, "First, connect to the API"
+        
+        if not CONTEXT_CACHE_SETTINGS["enabled"]:
+            return None
+        
+        context_key = self._make_context_key(model_name, corpus)
+        with LLM._context_lock:
+            now = time.time()
+            for expired_key in [key for key, entry in LLM._context_caches.items() if entry["expires_at"] <= now]:
+                del LLM._context_caches[expired_key]
+            
+            if (cache_name := self._get_alive_context_cache(context_key)) is not None:
+                return cache_name
+            
+            create_lock = LLM._context_create_locks.setdefault(context_key, threading.Lock())
+        
+        if self.estimate_tokens(model_name, corpus) < CONTEXT_CACHE_SETTINGS["min_tokens"]:
+            return None
+        
+        # Creating is done under the lock of the corpus, so concurrent jobs with the same corpus upload it once
+        # and requests with other corpora are not blocked by the upload
+        with create_lock:
+            with LLM._context_lock:
+                if (cache_name := self._get_alive_context_cache(context_key)) is not None:
+                    return cache_name
+            
+            try:
+                cached_content = self.client.caches.create(
+                    model=model_name,
+                    config=types.CreateCachedContentConfig(
+                        contents=[corpus],
+                        display_name="notebook-corpus",
+                        ttl=f"{int(CONTEXT_CACHE_SETTINGS['ttl'])}s"
+                    )
+                )
+                
+            except Exception as e:
+                return None
+            
+            with LLM._context_lock:
+                LLM._context_caches[context_key] = {
+                    "name"       : cached_content.name,
+                    "expires_at" : time.time() + CONTEXT_CACHE_SETTINGS["ttl"]
+                }
+                LLM._context_create_locks.pop(context_key, None)
+            
+            return cached_content.name
+    
+    
+    def _make_context_key(self, model_name, corpus: str) -> tuple[str, Any, str]:
+        """Function returns key of the context cache with 'corpus' for the model and API Key"""
+        
+        return (self.credential_key, model_name, hashlib.sha256(corpus.encode("utf-8")).hexdigest())
+    
+    
+    def _get_alive_context_cache(self, context_key: tuple[str, Any, str]) -> str | None:
+        """Function returns name of the context cache if it is not removed and does not expire soon, '_context_lock' must be held"""
+        
+        # Cache that expires in a moment is not used, a request with it could fail
+        entry = LLM._context_caches.get(context_key)
+        if entry is None or entry["expires_at"] - time.time() <= CONTEXT_CACHE_SETTINGS["refresh_margin"]:
+            return None
+        
+        return entry["name"]
+    
+    
+    def is_context_cache_alive(self, model_name, corpus: str, cache_name: str) -> bool:
+        """
+        Function checks if the context cache can still be used in requests
+
+        Args:
+            model_name (...): Name of selected model
+            corpus (str): Corpus of the cache
+            cache_name (str): Name of the cache from 'get_context_cache(...)'
+
+        Returns:
+            bool: False if the cache expired, expires soon or has been invalidated
+        """
+        
+        with LLM._context_lock:
+            return self._get_alive_context_cache(self._make_context_key(model_name, corpus)) == cache_name
+    
+    
+    def invalidate_context_cache(self, model_name, corpus: str) -> None:
+        """
+        Function removes the context cache with 'corpus', the next request creates it again
+
+        Args:
+            model_name (...): Name of selected model
+            corpus (str): Corpus of the cache
+        """
+        assert self.is_connected is True, "First, connect to the API"
+        
+        context_key = self._make_context_key(model_name, corpus)
+        with LLM._context_lock:
+            entry = LLM._context_caches.pop(context_key, None)
+        
+        if entry is None:
+            return
+        
+        try:
+            self.client.caches.delete(name=entry["name"])
+            
+        except Exception as e:
+            return
+    
+    
+    def _is_context_cache_error(self, error: Exception) -> bool:
+        """
+        Function checks if the error of request means that the context cache does not exist on the server
+        Other errors (e.g. rate limits) do not remove the cache, it is still used by other requests
+
+        Args:
+            error (Exception): Error raised by the API
+
+        Returns:
+            bool: True for "cached content not found" errors
+        """
+        
+        return getattr(error, "code", None) in (403, 404) and CONTEXT_CACHE_ERROR_PATTERN.search(str(error)) is not None
+    
+    
+    def _make_contents(self, model_name, prompt: str, corpus: str | None = None) -> tuple[str | list[str], dict[str, Any]]:
+        """
+        Function makes contents of request, the corpus is taken from the context cache if possible
+
+        Args:
+            model_name (...): Name of selected model
+            prompt (str): Prompt (instruction) sent after the corpus
+            corpus (str | None, optional): Large part of the prompt sent before it. Defaults to None.
+
+        Returns:
+            tuple[str | list[str], dict[str, Any]]: Contents and parameters added to config of generation
+        """
+        
+        if corpus is None:
+            return prompt, {}
+        
+        if (cache_name := self.get_context_cache(model_name, corpus)) is not None:
+            return [prompt], {"cached_content" : cache_name}
+        
+        return [corpus, prompt], {}
     
     
     def _format_output(self, response: str | None) -> dict[str, Any] | bool:
@@ -106,19 +571,196 @@ class LLM:
         return json.loads(repair_json(json_response))
     
     
-    def generate_notebook(self, model_name, prompt: str, **kwargs) -> dict[str, Any] | bool:
+    def generate_notebook_stream(self, model_name, prompt: str, structured: bool = False, corpus: str | None = None,
+                                 deadline: float | None = None, **kwargs) -> Iterator[tuple[str, Any]]:
+        """
+        Function generates new notebook based on the given prompt and reads the response as a stream
+        Every completed entry of 'sections' is yielded as soon as it arrives
+        With 'deadline' the request gets only the time left as its timeout and the stream is not read after it
+
+        Args:
+            model_name (...): Name of selected model
+            prompt (str): Prompt to generate a response by model
+            structured (bool, optional): Use structured output with 'NOTEBOOK_RESPONSE_SCHEMA'. Defaults to False.
+            corpus (str | None, optional): Notebooks sent before the prompt through the context cache. Defaults to None.
+            deadline (float | None, optional): Time ('time.monotonic()') when generation is stopped. Defaults to None (no limit).
+
+        Yields:
+            Iterator[tuple[str, Any]]: ("section", dict with section) for each section,
+                                       then ("notebook", ready notebook or bool (False) as error)
+        """
+        assert self.is_connected is True, "First, connect to the API"
+
+        section_parser = SectionStreamParser()
+        contents, cache_config = self._make_contents(model_name, prompt, corpus)
+        if deadline is not None:
+            cache_config["http_options"] = types.HttpOptions(timeout=max(int((deadline - time.monotonic()) * 1000), 1))
+        
+        response_stream = self.client.models.generate_content_stream(
+            model=model_name,
+            contents=contents,
+            config=self._make_generate_config(structured, **kwargs, **cache_config)
+        )
+        for chunk in response_stream:
+            # Timeout of the request limits waiting for each chunk, not the whole stream
+            if deadline is not None and time.monotonic() > deadline:
+                response_stream.close()
+                yield "notebook", False
+                return
+            
+            for section_data in section_parser.feed(chunk.text or ""):
+                yield "section", section_data
+
+        yield "notebook", self._check_notebook_output(section_parser.buffer, structured)
+    
+    
+    def generate_notebook_with_retry(self, model_name, prompt: str, retry_policy: RetryPolicy | None = None,
+                                     use_cache: bool = True, corpus: str | None = None, **kwargs) -> Iterator[tuple[str, Any]]:
         """
-        Function can generate new response (notebook) based on given prompt
+        Function generates new notebook with streaming, repeating invalid responses according to 'retry_policy'
+        The deadline of the policy also limits each request, its stream is not read after the deadline
+        Valid notebooks are cached by hash of the prompt, model name and parameters of generation,
+        so the same request returns the saved notebook without calling the model
 
         Args:
             model_name (...): Name of selected model
             prompt (str): Prompt to generate a response by model
+            retry_policy (RetryPolicy | None, optional): Limits of repeating. Defaults to None (default policy).
+            use_cache (bool, optional): Read and save notebooks in the response cache. Defaults to True.
+            corpus (str | None, optional): Notebooks sent before the prompt through the context cache. Defaults to None.
+
+        Yields:
+            Iterator[tuple[str, Any]]: Events of 'generate_notebook_stream(...)', ("retry", number of attempt)
+                                       before each next attempt and finally ("notebook", notebook or bool (False))
+        """
+        assert self.is_connected is True, "First, connect to the API"
+        
+        retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        cache_key = hashlib.sha256(json.dumps({
+            "prompt" : hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            "corpus" : hashlib.sha256(corpus.encode("utf-8")).hexdigest() if corpus is not None else None,
+            "model"  : model_name,
+            "config" : kwargs
+        }, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        
+        if use_cache and (cached_notebook := self.response_cache.get(cache_key)) is not None:
+            yield "notebook", cached_notebook
+            return
+        
+        deadline_time = time.monotonic() + retry_policy.deadline
+        for attempt in range(1, retry_policy.max_attempts + 1):
+            response = False
+            try:
+                for event, payload in self.generate_notebook_stream(model_name, prompt, corpus=corpus, deadline=deadline_time, **kwargs):
+                    if event == "notebook":
+                        response = payload
+                    else:
+                        yield event, payload
+                        
+            except Exception as e:
+                # The context cache could be removed on the server, the next attempt creates it again
+                if corpus is not None and self._is_context_cache_error(e):
+                    self.invalidate_context_cache(model_name, corpus)
+                response = False
+            
+            if not isinstance(response, bool):
+                if use_cache:
+                    self.response_cache.put(cache_key, response)
+                yield "notebook", response
+                return
+            
+            # Next attempt only if it can start before the deadline
+            delay = retry_policy.get_delay(attempt)
+            if attempt == retry_policy.max_attempts or time.monotonic() + delay > deadline_time:
+                break
+            
+            time.sleep(delay)
+            yield "retry", attempt + 1
+        
+        yield "notebook", False
+    
+    
+    def summarize_notebooks(self, model_name, prompt: str, use_cache: bool = True, **kwargs) -> str | None:
+        """
+        Function makes a text digest of notebooks in the prompt (map stage of long-context mode)
+        Digests are cached like notebooks, by hash of the prompt, model name and parameters of generation
+
+        Args:
+            model_name (...): Name of selected model
+            prompt (str): Prompt with summary instruction and notebooks of one shard
+            use_cache (bool, optional): Read and save digests in the response cache. Defaults to True.
 
         Returns:
-            dict[str, Any] | bool: Ready, formatted repository or bool (False) as error
+            str | None: Digest or None as error
+        """
+        assert self.is_connected is True, "First, connect to the API"
+        
+        cache_key = hashlib.sha256(json.dumps({
+            "prompt" : hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            "model"  : model_name,
+            "config" : kwargs,
+            "stage"  : "digest"
+        }, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        
+        if use_cache and (cached_digest := self.response_cache.get(cache_key)) is not None:
+            return cached_digest["digest"]
+        
+        try:
+            digest = self.client.models.generate_content(
+                model=model_name,
+                contents=prompt,
+                config=self._make_generate_config(**kwargs)
+            ).text
+            
+        except Exception as e:
+            return None
+        
+        if not digest or not digest.strip():
+            return None
+        
+        if use_cache:
+            self.response_cache.put(cache_key, {"digest" : digest})
+        
+        return digest
+    
+    
+    def summarize_notebooks_parallel(self, model_name, prompts: list[str], max_workers: int = 4,
+                                     use_cache: bool = True, **kwargs) -> Iterator[tuple[int, str | None]]:
+        """
+        Function runs 'summarize_notebooks(...)' for all prompts at the same time
+        Time of the map stage is bounded by the slowest shard, not by the number of notebooks
+
+        Args:
+            model_name (...): Name of selected model
+            prompts (list[str]): Summary prompts, one for each shard
+            max_workers (int, optional): Number of concurrent requests. Defaults to 4.
+            use_cache (bool, optional): Read and save digests in the response cache. Defaults to True.
+
+        Yields:
+            Iterator[tuple[int, str | None]]: Index of prompt and its digest (None as error) in order of completion
         """
         assert self.is_connected is True, "First, connect to the API"
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(prompts)))) as executor:
+            futures = {
+                executor.submit(self.summarize_notebooks, model_name, prompt, use_cache, **kwargs) : i
+                for i, prompt in enumerate(prompts)
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    
+    
+    def _make_generate_config(self, structured: bool = False, **kwargs) -> types.GenerateContentConfig:
+        """
+        Function makes config of generation with default values updated by 'kwargs'
 
+        Args:
+            structured (bool, optional): Add JSON response schema of notebook. Defaults to False.
+
+        Returns:
+            types.GenerateContentConfig: Config for 'generate_content(...)'
+        """
+        
         model_config = {
             "temperature" : 0.2,
             "top_p" : 0.8,
@@ -126,15 +768,69 @@ class LLM:
             "candidate_count" : 1,
             "max_output_tokens" : 8192,
         }
+        if structured:
+            model_config["response_mime_type"] = "application/json"
+            model_config["response_schema"] = NOTEBOOK_RESPONSE_SCHEMA
         model_config.update(kwargs)
+        
+        return types.GenerateContentConfig(**model_config)
+    
+    
+    def _validate_notebook(self, output: Any) -> bool:
+        """
+        Function quickly checks that output has the structure of 'NOTEBOOK_RESPONSE_SCHEMA'
 
-        llm_model_response = self.client.models.generate_content(
-            model=model_name,
-            contents=prompt,
-            config=types.GenerateContentConfig(**model_config)
-        )
+        Args:
+            output (Any): Parsed response of the model
 
-        if isinstance(formated_output := self._format_output(llm_model_response.text), bool):
+        Returns:
+            bool: True if the notebook is valid
+        """
+        
+        if not isinstance(output, dict) or not isinstance(new_notebook := output.get("new_notebook"), dict):
+            return False
+        
+        if not isinstance(new_notebook.get("title"), str) or not isinstance(new_notebook.get("sections"), list):
+            return False
+        
+        if not all(isinstance(section, dict) and isinstance(section.get("name"), str) for section in new_notebook["sections"]):
+            return False
+        
+        optimizations = new_notebook.get("optimizations")
+        if not isinstance(optimizations, dict) or not all(isinstance(optimizations.get(key), list) for key in ("implemented", "future")):
+            return False
+        
+        return isinstance(new_notebook.get("lessons_learned"), list)
+    
+    
+    def _check_notebook_output(self, response: str | None, structured: bool = False) -> dict[str, Any] | bool:
+        """
+        Function formats response and checks that it has a notebook
+        In structured mode the response is parsed directly, repairing JSON is only a fallback
+
+        Args:
+            response (str | None): LLM model response
+            structured (bool, optional): Response was generated with JSON schema. Defaults to False.
+
+        Returns:
+            dict[str, Any] | bool: Ready, formatted repository or bool (False) as error
+        """
+        
+        if structured and response is not None:
+            try:
+                if self._validate_notebook(formated_output := json.loads(response)):
+                    return formated_output
+                
+            except Exception as e:
+                pass
+        
+        try:
+            formated_output = self._format_output(response)
+            
+        except Exception as e:
+            return False
+        
+        if isinstance(formated_output, bool):
             return False
         
         if not isinstance(formated_output, dict) or formated_output.get("new_notebook", None) is None:
@@ -143,22 +839,295 @@ class LLM:
         return formated_output
     
 
-    def create_chat(self, model_name) -> None:
+    def create_chat(self, model_name, corpus: str | None = None, history: list[dict[str, Any]] | None = None,
+                    summary: str | None = None) -> None:
         """
         Creating new session of chat for selected model  
+        With 'corpus' the chat starts with the notebooks, taken from the context cache if possible
+        With 'history' the chat continues earlier messages (e.g. of a saved session)
 
         Args:
             model_name (_type_): _description_
+            corpus (str | None, optional): Notebooks the chat is about. Defaults to None.
+            history (list[dict[str, Any]] | None, optional): Messages with "role" ("user" or "assistant"), "content"
+                                                             and optionally "llm_content" (text sent to the model).
+                                                             Defaults to None.
+            summary (str | None, optional): Summary of messages before 'history' (see '_apply_chat_compaction()'). Defaults to None.
         """
         assert self.is_connected is True, "First, connect to the API"
 
-        self.chat = self.client.chats.create(model=model_name)
+        self.chat_model_name = model_name
+        self.chat_corpus = corpus
+        self.chat_cache_name = None
+        self.chat_config = None
+        self.chat_pinned_history = []
+        self.chat_turn_tokens = []
+        self.chat_attachments = {}
+        self.chat_summary = summary
+        self.chat_message_count = len(history or [])
+        self.chat_compaction = None
+
+        if corpus is not None:
+            self._set_chat_context()
+        
+        chat_history = self._make_summary_history(summary) if summary is not None else []
+        if summary is not None:
+            self.chat_turn_tokens.append(self.estimate_tokens(model_name, summary))
+        
+        # Each restored turn is counted separately, so compaction can drop the old ones
+        for message in history or []:
+            content = message.get("llm_content", message["content"])
+            chat_history.append(types.Content(role="user" if message["role"] == "user" else "model", parts=[types.Part(text=content)]))
+            
+            message_tokens = self.estimate_tokens(model_name, content)
+            if message["role"] == "user" or not self.chat_turn_tokens:
+                self.chat_turn_tokens.append(message_tokens)
+            else:
+                self.chat_turn_tokens[-1] += message_tokens
+        
+        self._open_chat(chat_history)
         self.is_chat_started = True
+    
+    
+    def _make_summary_history(self, summary: str) -> list[types.Content]:
+        """Function returns turn of the chat that gives the summary of earlier messages to the model"""
+        
+        return [
+            types.Content(role="user", parts=[types.Part(text=f"Summary of our earlier conversation:\n{summary}")]),
+            types.Content(role="model", parts=[types.Part(text="Thanks, I will keep it in mind.")])
+        ]
+    
+    
+    def _set_chat_context(self) -> None:
+        """
+        Function gives the corpus of the chat to the model, through the context cache if possible
+        Without the cache the notebooks are the first message of history, it is never compacted
+        """
+        
+        self.chat_cache_name = self.get_context_cache(self.chat_model_name, self.chat_corpus) # type: ignore
+        if self.chat_cache_name is not None:
+            self.chat_config = types.GenerateContentConfig(cached_content=self.chat_cache_name)
+            self.chat_pinned_history = []
+        else:
+            self.chat_config = None
+            self.chat_pinned_history = [
+                types.Content(role="user", parts=[types.Part(text=self.chat_corpus)]),
+                types.Content(role="model", parts=[types.Part(text="I have read the notebooks. Ask me about them.")])
+            ]
+    
+    
+    def _refresh_chat_context(self) -> None:
+        """
+        Function opens the chat again with a new context cache (or the pinned corpus) if its cache
+        has expired or has been invalidated, the history of the chat is kept
+        """
+        
+        if self.chat_cache_name is None or self.is_context_cache_alive(self.chat_model_name, self.chat_corpus, self.chat_cache_name): # type: ignore
+            return
+        
+        history = self.chat.get_history()[len(self.chat_pinned_history):]
+        self._set_chat_context()
+        self._open_chat(history)
+    
+    
+    def _open_chat(self, history: list[types.Content] | None = None) -> None:
+        """Function opens chat session with pinned history followed by 'history'"""
+        
+        self.chat = self.client.chats.create(
+            model=self.chat_model_name,
+            config=self.chat_config,
+            history=[*self.chat_pinned_history, *(history or [])]
+        )
+
+    
+    def send_message_stream(self, prompt: str) -> Iterator[str]:
+        """
+        Send message to Google Gemini API and yield the answer in chunks as soon as they arrive
+        The message and the whole answer are saved in history of the chat
+
+        Args:
+            prompt (str): Message of the user
+
+        Yields:
+            Iterator[str]: Next chunks of text of the answer
+        """
+        assert self.is_connected is True, "First, connect to the API"
+        assert self.is_chat_started is True, "First, start a chat"
+
+        self._apply_chat_compaction()
+        self._refresh_chat_context()
+        answer = ""
+        try:
+            for chunk in self.chat.send_message_stream(prompt):
+                if chunk.text:
+                    answer += chunk.text
+                    yield chunk.text
+        
+        # Message is sent again only if nothing of the answer has been shown
+        except Exception as e:
+            if answer or not self._recover_chat_context(e):
+                raise
+            for chunk in self.chat.send_message_stream(prompt):
+                if chunk.text:
+                    answer += chunk.text
+                    yield chunk.text
+        
+        self.chat_message_count += 2
+        self._track_chat_turn(prompt, answer)
+    
+    
+    def _recover_chat_context(self, error: Exception) -> bool:
+        """
+        Function opens the chat again without its context cache if the cache was removed on the server
+
+        Args:
+            error (Exception): Error of sending the message
+
+        Returns:
+            bool: True if the chat has been opened again and the message can be sent again
+        """
+        
+        if self.chat_cache_name is None or not self._is_context_cache_error(error):
+            return False
+        
+        self.invalidate_context_cache(self.chat_model_name, self.chat_corpus) # type: ignore
+        self._refresh_chat_context()
+        
+        return True
+    
+    
+    def remember_chat_attachment(self, attachment: dict[str, Any]) -> None:
+        """
+        Function saves the attachment sent in the chat, so its next versions can be sent as diffs
 
+        Args:
+            attachment (dict[str, Any]): Attachment with "name", "content_hash" and "cells"
+        """
+        
+        earlier_attachment = self.chat_attachments.get(attachment["name"])
+        if earlier_attachment is not None and earlier_attachment["content_hash"] == attachment["content_hash"]:
+            return
+        
+        self.chat_attachments[attachment["name"]] = {
+            "content_hash" : attachment["content_hash"],
+            "cells"        : attachment["cells"],
+            "version"      : earlier_attachment["version"] + 1 if earlier_attachment is not None else 1,
+        }
+    
     
-    def send_message(self, prompt: str) -> str | None:
-        """Send message to Google Gemini API"""
+    def get_chat_history_tokens(self) -> int:
+        """Function returns estimated number of tokens in compactable history of the chat"""
+        
+        return sum(self.chat_turn_tokens)
+    
+    
+    def _track_chat_turn(self, prompt: str, answer: str) -> None:
+        """
+        Function saves estimated tokens of the turn and starts compaction of history over 'max_tokens'
+
+        Args:
+            prompt (str): Message of the user
+            answer (str): Whole answer of the model
+        """
+        
+        self.chat_turn_tokens.append(self.estimate_tokens(self.chat_model_name, prompt) + self.estimate_tokens(self.chat_model_name, answer))
+        if self.get_chat_history_tokens() > CHAT_HISTORY_SETTINGS["max_tokens"]:
+            self.start_chat_compaction()
+    
+    
+    def start_chat_compaction(self) -> None:
+        """
+        Function starts summarizing old turns of the chat in the background, the last 'keep_recent_turns' turns are kept verbatim
+        The answer that crossed the limit is not delayed, the chat keeps its whole history until the summary
+        is ready and the compacted history is used from the next message (see '_apply_chat_compaction()')
+        """
         assert self.is_connected is True, "First, connect to the API"
         assert self.is_chat_started is True, "First, start a chat"
+        
+        if self.chat_compaction is not None:
+            return
+        
+        history = self.chat.get_history()[len(self.chat_pinned_history):]
+        keep_contents = 2 * CHAT_HISTORY_SETTINGS["keep_recent_turns"]
+        if len(history) <= keep_contents:
+            return
+        
+        old_history = history[:-keep_contents]
+        self.chat_compaction = {
+            "future"       : LLM._summary_executor.submit(self._summarize_chat_history, self.chat_model_name, old_history),
+            "old_contents" : len(old_history),
+            "old_turns"    : max(len(self.chat_turn_tokens) - CHAT_HISTORY_SETTINGS["keep_recent_turns"], 0),
+        }
+    
+    
+    def _apply_chat_compaction(self, wait: bool = False) -> None:
+        """
+        Function replaces old turns of the chat with their summary when it is ready
+        Attachments of old turns are only mentioned in the summary. If the summary cannot be made, old turns are dropped.
+        The size of history stays bounded, so each next turn sends about the same number of tokens.
+        The summary is kept in 'chat_summary' and the number of verbatim messages in 'chat_message_count',
+        so a saved session can be continued with the same history.
+
+        Args:
+            wait (bool, optional): Wait for the summary instead of leaving the history for later. Defaults to False.
+        """
+        
+        if self.chat_compaction is None or (not wait and not self.chat_compaction["future"].done()):
+            return
+        
+        summary = self.chat_compaction["future"].result()
+        history = self.chat.get_history()[len(self.chat_pinned_history):]
+        
+        # Turns sent while the summary was made stay with the recent ones
+        recent_history = history[self.chat_compaction["old_contents"]:]
+        compacted_history = []
+        self.chat_turn_tokens = self.chat_turn_tokens[self.chat_compaction["old_turns"]:]
+        self.chat_compaction = None
+        
+        if summary is not None:
+            compacted_history = self._make_summary_history(summary)
+            self.chat_turn_tokens.insert(0, self.estimate_tokens(self.chat_model_name, summary))
+        self.chat_summary = summary
+        self.chat_message_count = len(recent_history)
+        
+        # Sent files could be only in the summary now, so their next versions are sent whole
+        self.chat_attachments = {}
+        if self.chat_cache_name is not None and not self.is_context_cache_alive(self.chat_model_name, self.chat_corpus, self.chat_cache_name): # type: ignore
+            self._set_chat_context()
+        self._open_chat([*compacted_history, *recent_history])
+    
+    
+    def _summarize_chat_history(self, model_name, history: list[types.Content]) -> str | None:
+        """
+        Function summarizes turns of the chat with the instruction from 'summarize_chat_prompt.txt'
+        It runs in a background thread, so it does not read the state of the chat
+
+        Args:
+            model_name (...): Name of the model of the chat
+            history (list[types.Content]): Turns of the chat to summarize
 
-        return self.chat.send_message(prompt).text
\ No newline at end of file
+        Returns:
+            str | None: Summary or None as error
+        """
+        
+        conversation = "\n\n".join(
+            f"{content.role}:\n{''.join(part.text or '' for part in content.parts or [])}" for content in history
+        )
+        try:
+            with open(
+                file=os.path.join(PathVariable.TEMPLATE_PATH.value, "summarize_chat_prompt.txt"),
+                mode="r",
+                encoding="utf-8"
+            ) as f:
+                instruction_prompt = f.read()
+            
+            summary = self.client.models.generate_content(
+                model=model_name,
+                contents=f"{instruction_prompt}\n<conversation>\n{conversation}\n</conversation>",
+                config=self._make_generate_config(max_output_tokens=CHAT_HISTORY_SETTINGS["summary_max_output_tokens"])
+            ).text
+            
+        except Exception as e:
+            return None
+        
+        return summary if summary and summary.strip() else None
@@ -0,0 +1,206 @@
+from typing import Any
+import json
+import re
+
+
+
+# Escape sequences (colors) used in tracebacks of Jupyter errors
+ANSI_ESCAPE_PATTERN = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+# Order of MIME types used to display outputs, the first one found is used
+DISPLAY_DATA_PRIORITY = [
+    "text/html",
+    "text/markdown",
+    "image/svg+xml",
+    "text/latex",
+    "image/png",
+    "image/jpeg",
+    "text/plain",
+]
+
+IMAGE_EXTENSIONS = {
+    "image/svg+xml" : "svg",
+    "image/png"     : "png",
+    "image/jpeg"    : "jpeg",
+}
+
+
+
+class NotebookConverter:
+
+    BACKENDS = ("native", "nbconvert")
+
+    def __init__(self, backend: str = "native") -> None:
+        assert backend in self.BACKENDS, f"Backend must be one of {self.BACKENDS}"
+
+        self.backend = backend
+        self.markdown_exporter = None
+
+        # nbconvert is imported only when it is selected, it is slow to load
+        if self.backend == "nbconvert":
+            from nbconvert import MarkdownExporter
+            self.markdown_exporter = MarkdownExporter()
+
+
+    def convert_source(self, notebook_source: str) -> str:
+        """
+        Function converts notebook from its JSON text (e.g. 'source' of kernel) to Markdown
+        The text is parsed once and nothing is written to disk
+
+        Args:
+            notebook_source (str): Notebook in JSON format as text
+
+        Returns:
+            str: Notebook in Markdown format
+        """
+
+        return self.convert_notebook(json.loads(notebook_source))
+
+
+    def convert_notebook(self, notebook: dict[str, Any]) -> str:
+        """
+        Function converts notebook in JSON format to Markdown with selected backend
+
+        Args:
+            notebook (dict[str, Any]): Notebook loaded from .ipynb
+
+        Returns:
+            str: Notebook in Markdown format
+        """
+
+        if self.backend == "nbconvert":
+            import nbformat
+
+            # Notebook is read like from a file, so lines of 'source' and outputs are joined
+            notebook_content = nbformat.reads(json.dumps(notebook), as_version=4)
+            body, _ = self.markdown_exporter.from_notebook_node(notebook_content) # type: ignore
+            return body
+
+        return self._convert_native(notebook)
+
+
+    def convert_notebook_cells(self, notebook: dict[str, Any]) -> list[str]:
+        """
+        Function converts every cell of notebook (with its outputs) to Markdown separately
+        It always uses the native layout, cells without content are left out
+
+        Args:
+            notebook (dict[str, Any]): Notebook loaded from .ipynb
+
+        Returns:
+            list[str]: Cells in Markdown format
+        """
+
+        if notebook.get("nbformat", 4) < 4:
+            raise ValueError("Only nbformat 4 notebooks are supported")
+
+        language = notebook.get("metadata", {}).get("language_info", {}).get("name", "")
+
+        cells_markdown = []
+        for cell_index, cell in enumerate(notebook.get("cells", [])):
+            if cell_markdown := self._convert_native_cell(cell, cell_index, language):
+                cells_markdown.append(cell_markdown)
+
+        return cells_markdown
+
+
+    def _convert_native(self, notebook: dict[str, Any]) -> str:
+        """
+        Function walks over notebook cells and lays them out like nbconvert 'MarkdownExporter'
+        Markdown cells are copied, code cells are fenced and outputs are added below them
+
+        Args:
+            notebook (dict[str, Any]): Notebook in nbformat 4
+
+        Returns:
+            str: Notebook in Markdown format
+        """
+
+        return "\n\n".join(self.convert_notebook_cells(notebook)) + "\n"
+
+
+    def _convert_native_cell(self, cell: dict[str, Any], cell_index: int, language: str) -> str:
+        """
+        Function converts one cell and its outputs to Markdown
+
+        Args:
+            cell (dict[str, Any]): Cell of notebook
+            cell_index (int): Index of cell in notebook
+            language (str): Language of notebook kernel
+
+        Returns:
+            str: Cell in Markdown format (empty if it has no content)
+        """
+
+        cell_source = self._join_text(cell.get("source", ""))
+        cell_type = cell.get("cell_type")
+
+        markdown_parts = []
+        if cell_type == "markdown":
+            markdown_parts.append(cell_source)
+
+        elif cell_type == "code":
+            cell_language = cell.get("metadata", {}).get("magics_language", language)
+            markdown_parts.append(f"```{cell_language}\n{cell_source}\n```")
+
+            for output_index, output in enumerate(cell.get("outputs", [])):
+                if output_markdown := self._convert_output(output, cell_index, output_index):
+                    markdown_parts.append(output_markdown)
+
+        elif cell_type == "raw":
+            if cell.get("metadata", {}).get("raw_mimetype", "").lower() in ("", "text/markdown", "text/html"):
+                markdown_parts.append(cell_source)
+
+        return "\n\n".join(part.strip("\n") for part in markdown_parts if part.strip())
+
+
+    def _convert_output(self, output: dict[str, Any], cell_index: int, output_index: int) -> str:
+        """
+        Function converts single output of code cell to Markdown
+
+        Args:
+            output (dict[str, Any]): Output of code cell
+            cell_index (int): Number of cell, used in names of images
+            output_index (int): Number of output in cell, used in names of images
+
+        Returns:
+            str: Output in Markdown format
+        """
+
+        output_type = output.get("output_type")
+
+        if output_type == "stream":
+            return self._indent(self._join_text(output.get("text", "")))
+
+        if output_type == "error":
+            traceback = "\n".join(output.get("traceback", []))
+            return self._indent(ANSI_ESCAPE_PATTERN.sub("", traceback))
+
+        if output_type in ("execute_result", "display_data"):
+            output_data = output.get("data", {})
+            for mime_type in DISPLAY_DATA_PRIORITY:
+                if mime_type not in output_data:
+                    continue
+
+                if mime_type in IMAGE_EXTENSIONS:
+                    extension = IMAGE_EXTENSIONS[mime_type]
+                    return f"![{extension}](output_{cell_index}_{output_index}.{extension})"
+
+                if mime_type == "text/plain":
+                    return self._indent(self._join_text(output_data[mime_type]))
+
+                return self._join_text(output_data[mime_type])
+
+        return ""
+
+
+    def _join_text(self, text: str | list[str]) -> str:
+        """Function joins multiline text saved in notebook as list of lines"""
+
+        return "".join(text) if isinstance(text, list) else text
+
+
+    def _indent(self, text: str) -> str:
+        """Function indents text by 4 spaces, in Markdown it is a code block"""
+
+        return "\n".join(f"    {line}" if line.strip() else line for line in text.rstrip("\n").split("\n"))
@@ -0,0 +1,322 @@
+from typing import Any
+from config import PathVariable, CORPUS_CACHE_MAX_BYTES, KAGGLE_MAX_WORKERS, NOTEBOOK_CONVERT_MAX_WORKERS, SAVE_DOWNLOADED_NOTEBOOKS, PROMPT_TOKENS_RESERVE_RATIO, PROMPT_PACKING_MAX_ATTEMPTS, GENERATION_RETRY_SETTINGS, STRUCTURED_GENERATION, MAP_REDUCE_SETTINGS
+from kaggle_api import MyKaggleApi, KernelCache
+from data_maker import DataMaker
+from disk_cache import DiskCache
+from job_runner import Job
+from llm import LLM, RetryPolicy
+import hashlib
+import json
+import os
+
+
+# Notebooks of finished jobs are kept on disk, results of jobs only point to them
+corpus_cache = DiskCache(
+    cache_dir=os.path.join(PathVariable.CACHE_PATH.value, "corpora"),
+    max_bytes=CORPUS_CACHE_MAX_BYTES
+)
+
+
+
+def make_corpus_key(corpus: str) -> str:
+    """Function returns key of the corpus in 'corpus_cache'"""
+
+    return hashlib.sha256(corpus.encode("utf-8")).hexdigest()
+
+
+
+def make_job_key(settings: dict[str, Any]) -> str:
+    """
+    Function returns key of the generation request, equal requests of different sessions have the same key
+    Names of dataset and competition are normalized (case and surrounding spaces are ignored)
+
+    Args:
+        settings (dict[str, Any]): Settings of 'run_notebook_generation(...)'
+
+    Returns:
+        str: Hash of normalized settings
+    """
+
+    normalized_settings = {
+        **settings,
+        "dataset"     : settings["dataset"].strip().lower(),
+        "competition" : settings["competition"].strip().lower(),
+    }
+
+    return hashlib.sha256(json.dumps(normalized_settings, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+
+def run_notebook_generation(job: Job, kaggle_api: MyKaggleApi, llm: LLM, settings: dict[str, Any]) -> None:
+    """
+    Function runs the whole pipeline of generating notebook as a background job
+    Kernels are fetched and converted, the prompt is checked and the notebook is generated and saved.
+    Stages, warnings and streamed sections are reported in 'job', errors end the job as failed.
+
+    Args:
+        job (Job): Job of 'JobRunner'
+        kaggle_api (MyKaggleApi): Kaggle API of the session, only its connection is used
+        llm (LLM): Connected LLM object
+        settings (dict[str, Any]): Dict with "dataset", "competition", "page_num", "page_size", "sort_by",
+                                   "model_name", "model_params", "max_input_tokens" and "mode"
+                                   ("single" or "map_reduce" for long-context mode)
+    """
+
+    # The job has its own objects, so failed kernels, notebooks and cache counters of concurrent jobs are not mixed
+    # Its kernel cache uses the same directory as the cache of the session
+    job_kaggle_api = MyKaggleApi(kernel_cache=KernelCache(
+        cache_dir=kaggle_api.kernel_cache.cache_dir,
+        max_bytes=kaggle_api.kernel_cache.max_bytes
+    ))
+    job_kaggle_api.load_api(kaggle_api.api)
+    maker = DataMaker()
+
+    max_input_tokens = settings["max_input_tokens"]
+
+    job.update("Fetching notebooks from Kaggle", 0.05)
+    kernels_iterator = job_kaggle_api.iter_kernels(
+        competition=settings["competition"] if settings["competition"] else None,
+        dataset=settings["dataset"] if settings["dataset"] else None,
+        total=settings["page_num"] * settings["page_size"],
+        page_size=settings["page_size"],
+        language="python",
+        sort_by=settings["sort_by"]
+    )
+    kernels_metadata = job_kaggle_api.get_kernels_specification(
+        kernels_iterator,
+        max_workers=KAGGLE_MAX_WORKERS
+    )
+
+    if len(kernels_metadata) == 0 and not job_kaggle_api.failed_kernels:
+        job.fail("No Dataset Notebooks Detected" if settings["dataset"] else "No Competition Notebooks Detected")
+        return
+
+    kernel_cache_stats = job_kaggle_api.kernel_cache.get_stats()
+    job.add_message("caption", f"Kernel cache: {kernel_cache_stats['hits']} hits / {kernel_cache_stats['misses']} misses")
+
+    # Kernels that could not be pulled are skipped, the rest is used
+    if job_kaggle_api.failed_kernels:
+        job.add_message("warning", "Skipped Notebooks: " + ", ".join(kernel["ref"] for kernel in job_kaggle_api.failed_kernels))
+
+    if len(kernels_metadata) == 0:
+        job.fail("Error With Downloading Notebooks")
+        return
+
+    # Save 'source' in the notebook store (only for debugging, the prompt is made in memory)
+    if SAVE_DOWNLOADED_NOTEBOOKS:
+        for metadata in kernels_metadata:
+            if not maker.download_notebook(metadata):
+                job.fail("Error With Saving Notebook")
+                return
+
+    # In single mode notebooks are the corpus sent through the context cache, the prompt is the instruction only
+    job.update("Converting notebooks", 0.3)
+    corpus = None
+    if settings.get("mode") == "map_reduce":
+        prompt = run_map_stage(job, maker, llm, kernels_metadata, settings)
+    else:
+        prompt_parts = run_pack_stage(job, maker, llm, kernels_metadata, settings)
+        prompt, corpus = prompt_parts if not isinstance(prompt_parts, bool) else (False, None)
+    if isinstance(prompt, bool):
+        job.fail("Error With Making Prompt")
+        return
+
+    if maker.failed_notebooks:
+        job.add_message("warning", "Notebooks Not Converted: " + ", ".join(maker.failed_notebooks))
+
+    if maker.sanitize_reports:
+        job.add_message(
+            "caption",
+            f"Stripped outputs: {sum(report['chars_saved'] for report in maker.sanitize_reports.values())} characters / "
+            f"~{sum(report['tokens_saved'] for report in maker.sanitize_reports.values())} tokens saved"
+        )
+
+    if maker.skipped_notebooks:
+        job.add_message("info", f"{len(maker.skipped_notebooks)} Notebooks Left Out To Fit The Input Token Limit")
+
+    # Both modes end with one generation, in long-context mode its prompt has digests instead of notebooks
+
+    # Limit prompt to model limit tokens
+    job.update("Counting tokens", 0.45)
+    full_prompt = f"{corpus}\n{prompt}" if corpus is not None else prompt
+    if llm.count_tokens(settings["model_name"], full_prompt, limit=max_input_tokens) > max_input_tokens:
+        job.fail("To Many Input Tokens. Chnage 'Pages' or 'Page Size'")
+        return
+
+    # Invalid responses are generated again with backoff, within the limits of retry policy
+    job.update("Generating notebook", 0.5)
+    response = False
+    for event, payload in llm.generate_notebook_with_retry(
+        settings["model_name"],
+        prompt,
+        retry_policy=RetryPolicy(**GENERATION_RETRY_SETTINGS),
+        structured=STRUCTURED_GENERATION,
+        corpus=corpus,
+        **settings["model_params"]
+    ):
+        if event == "section":
+            job.sections.append(maker.format_generated_section(payload))
+
+        elif event == "retry":
+            job.sections = []
+            job.add_message("warning", f"Invalid response, attempt {payload}")
+
+        else:
+            response = payload
+
+    if isinstance(response, bool):
+        job.fail("Error With Generating Notebook. Try Again Later")
+        return
+
+    job.update("Saving notebook", 0.95)
+    try:
+        # Read template for analyzed notebooks
+        with open(
+            file=os.path.join(PathVariable.TEMPLATE_PATH.value, "generated_notebook_template.txt"),
+            mode="r",
+            encoding="utf-8"
+        ) as f:
+            generated_template = f.read()
+
+    except Exception as e:
+        job.fail("Error Reading Template - generated_notebook_template.txt")
+        return
+
+    md_generated_notebook = maker.format_generated_notebook(
+        generated_notebook_data=response.get("new_notebook"),
+        template=generated_template
+    )
+
+    # Save notebook to 'Save', the result stays available after the session ends
+    name = settings["dataset"] if settings["dataset"] else settings["competition"]
+    if not maker.save_new_markdown(markdown_text=md_generated_notebook, name=name):
+        job.fail("Saving Error")
+        return
+
+    corpus_key = None
+    if corpus is not None:
+        corpus_key = make_corpus_key(corpus)
+        corpus_cache.put(corpus_key, {"corpus" : corpus})
+
+    job.result = {
+        "markdown"     : md_generated_notebook,
+        "new_notebook" : response.get("new_notebook"),
+        "corpus_key"   : corpus_key,
+    }
+
+
+
+def run_pack_stage(job: Job, maker: DataMaker, llm: LLM, kernels_metadata: list[dict[str, Any]],
+                   settings: dict[str, Any]) -> tuple[str, str] | bool:
+    """
+    Function converts notebooks and packs them into the prompt of single mode
+    The token estimate is calibrated on a sample of notebooks before packing. If the exact count
+    of the packed prompt is still over the limit, notebooks are packed again into a budget
+    smaller by the error of the estimate.
+
+    Args:
+        job (Job): Job of 'JobRunner'
+        maker (DataMaker): DataMaker of the job
+        llm (LLM): Connected LLM object
+        kernels_metadata (list[dict[str, Any]]): List of dicts with kernel specification
+        settings (dict[str, Any]): Settings of 'run_notebook_generation(...)'
+
+    Returns:
+        tuple[str, str] | bool: Instruction and corpus of <notebook> blocks or bool (False) as error
+    """
+
+    max_input_tokens = settings["max_input_tokens"]
+    notebook_blocks = maker.make_notebook_blocks(kernels_metadata, max_workers=NOTEBOOK_CONVERT_MAX_WORKERS)
+    llm.calibrate_estimator(settings["model_name"], [block for _, block in notebook_blocks])
+
+    packing_tokens = max_input_tokens
+    for attempt in range(1, PROMPT_PACKING_MAX_ATTEMPTS + 1):
+        prompt_parts = maker.make_notebook_generator_prompt_parts(
+            kernels_spec=kernels_metadata,
+            file_instruction="generate_notebook_prompt.txt",
+            max_tokens=packing_tokens,
+            count_tokens=lambda text: llm.estimate_tokens(settings["model_name"], text),
+            reserved_tokens=int(max_input_tokens * PROMPT_TOKENS_RESERVE_RATIO),
+            notebook_blocks=notebook_blocks
+        )
+        if isinstance(prompt_parts, bool):
+            return False
+
+        # The exact count is cached, the next check of the prompt does not call the API again
+        total_tokens = llm.count_tokens(settings["model_name"], f"{prompt_parts[1]}\n{prompt_parts[0]}", limit=max_input_tokens)
+        if total_tokens <= max_input_tokens or attempt == PROMPT_PACKING_MAX_ATTEMPTS:
+            break
+
+        job.add_message("caption", f"Prompt has {total_tokens} tokens, notebooks are packed again")
+        packing_tokens = int(packing_tokens * max_input_tokens / total_tokens)
+
+    return prompt_parts
+
+
+
+def run_map_stage(job: Job, maker: DataMaker, llm: LLM, kernels_metadata: list[dict[str, Any]],
+                  settings: dict[str, Any]) -> str | bool:
+    """
+    Function runs the map stage of long-context mode and returns the prompt of the reduce stage
+    Notebooks are split into shards of 'shard_tokens' (with the token estimate calibrated first) and each
+    shard is summarized in parallel into a digest. Shards whose summary failed are reported in 'job' and left out.
+
+    Args:
+        job (Job): Job of 'JobRunner'
+        maker (DataMaker): DataMaker of the job
+        llm (LLM): Connected LLM object
+        kernels_metadata (list[dict[str, Any]]): List of dicts with kernel specification
+        settings (dict[str, Any]): Settings of 'run_notebook_generation(...)'
+
+    Returns:
+        str | bool: Prompt with digests or bool (False) as error
+    """
+
+    max_input_tokens = settings["max_input_tokens"]
+    notebook_blocks = maker.make_notebook_blocks(kernels_metadata, max_workers=NOTEBOOK_CONVERT_MAX_WORKERS)
+    llm.calibrate_estimator(settings["model_name"], [block for _, block in notebook_blocks])
+
+    # Shards are much smaller than the input limit, so they are summarized in parallel and estimate errors do not matter
+    shard_tokens = min(MAP_REDUCE_SETTINGS["shard_tokens"], max_input_tokens)
+    for attempt in range(1, PROMPT_PACKING_MAX_ATTEMPTS + 1):
+        summary_prompts = maker.make_map_reduce_prompts(
+            kernels_spec=kernels_metadata,
+            file_instruction="generate_notebook_prompt.txt",
+            summary_instruction="summarize_notebooks_prompt.txt",
+            max_tokens=shard_tokens,
+            count_tokens=lambda text: llm.estimate_tokens(settings["model_name"], text),
+            reserved_tokens=int(shard_tokens * PROMPT_TOKENS_RESERVE_RATIO),
+            notebook_blocks=notebook_blocks
+        )
+        if isinstance(summary_prompts, bool):
+            return False
+
+        # Shard over the input limit would fail in the map stage, notebooks are split again into smaller shards
+        max_prompt_tokens = max(llm.count_tokens(settings["model_name"], prompt, limit=max_input_tokens) for prompt in summary_prompts)
+        if max_prompt_tokens <= max_input_tokens or attempt == PROMPT_PACKING_MAX_ATTEMPTS:
+            break
+
+        job.add_message("caption", f"Shard has {max_prompt_tokens} tokens, notebooks are split again")
+        shard_tokens = int(shard_tokens * max_input_tokens / max_prompt_tokens)
+
+    digests = [None] * len(summary_prompts)
+    job.update(f"Summarizing {len(summary_prompts)} shards", 0.35)
+    for done, (i, digest) in enumerate(llm.summarize_notebooks_parallel(
+        settings["model_name"],
+        summary_prompts,
+        max_workers=MAP_REDUCE_SETTINGS["max_workers"],
+        temperature=settings["model_params"]["temperature"],
+        max_output_tokens=MAP_REDUCE_SETTINGS["max_output_tokens"]
+    ), start=1):
+        digests[i] = digest
+        job.update(f"Summarizing shards ({done}/{len(summary_prompts)})", 0.35 + 0.1 * done / len(summary_prompts))
+
+    if failed_shards := [str(i + 1) for i, digest in enumerate(digests) if digest is None]:
+        job.add_message("warning", "Shards Not Summarized: " + ", ".join(failed_shards))
+
+    job.add_message("caption", f"Long-context mode: {len(summary_prompts)} shards summarized into digests")
+
+    return maker.make_digest_generator_prompt(
+        digests=[digest for digest in digests if digest is not None],
+        file_instruction="generate_notebook_prompt.txt"
+    )
@@ -0,0 +1,204 @@
+from typing import Any
+import re
+
+
+
+# Inline images in Markdown cells, e.g. ![plot](data:image/png;base64,...)
+INLINE_IMAGE_PATTERN = re.compile(r"!\[[^\]]*\]\(data:image/[^)]*\)")
+
+# Numbers are ignored when log lines are compared, e.g. 'Epoch 1/10 - loss 0.5'
+NUMBER_PATTERN = re.compile(r"\d+(\.\d+)?")
+
+
+
+class NotebookSanitizer:
+
+    def __init__(self, **kwargs) -> None:
+        # Default settings for sanitizing
+        self.settings = {
+            "drop_mime_types"       : ["image/png", "image/jpeg", "image/gif", "image/svg+xml", "text/html",
+                                       "application/javascript", "application/vnd.jupyter.widget-view+json"],
+            "max_output_chars"      : 2000,
+            "max_outputs_per_cell"  : 5,
+            "remove_attachments"    : True,
+            "collapse_log_lines"    : True,
+            "min_repeated_lines"    : 5,
+            "chars_per_token"       : 4,
+        }
+        self.settings.update(kwargs)
+
+
+    def sanitize(self, notebook: dict[str, Any]) -> tuple[dict[str, Any], dict[str, int]]:
+        """
+        Function removes heavy parts of notebook before conversion to Markdown
+        Outputs are dropped by MIME type and truncated by size, embedded images are removed
+        and repeated log lines are collapsed. The notebook is changed in place.
+
+        Args:
+            notebook (dict[str, Any]): Notebook loaded from .ipynb
+
+        Returns:
+            tuple[dict[str, Any], dict[str, int]]: Sanitized notebook and report with saved characters and tokens
+        """
+
+        removed_chars = 0
+        for cell in notebook.get("cells", []):
+            if self.settings["remove_attachments"]:
+                removed_chars += self._remove_attachments(cell)
+
+            if cell.get("cell_type") == "code":
+                removed_chars += self._sanitize_outputs(cell)
+
+        return notebook, {
+            "chars_saved"  : removed_chars,
+            "tokens_saved" : removed_chars // self.settings["chars_per_token"],
+        }
+
+
+    def _remove_attachments(self, cell: dict[str, Any]) -> int:
+        """
+        Function removes attachments and inline base64 images from cell
+
+        Args:
+            cell (dict[str, Any]): Cell of notebook
+
+        Returns:
+            int: Number of removed characters
+        """
+
+        removed_chars = 0
+        if attachments := cell.pop("attachments", None):
+            removed_chars += sum(len(str(data)) for data in attachments.values())
+
+        if cell.get("cell_type") == "markdown":
+            cell_source = self._join_text(cell.get("source", ""))
+            sanitized_source = INLINE_IMAGE_PATTERN.sub("[image removed]", cell_source)
+            removed_chars += len(cell_source) - len(sanitized_source)
+            cell["source"] = sanitized_source
+
+        return removed_chars
+
+
+    def _sanitize_outputs(self, cell: dict[str, Any]) -> int:
+        """
+        Function drops, truncates and collapses outputs of code cell
+
+        Args:
+            cell (dict[str, Any]): Code cell of notebook
+
+        Returns:
+            int: Number of removed characters
+        """
+
+        removed_chars = 0
+        sanitized_outputs = []
+        for output in cell.get("outputs", []):
+            if len(sanitized_outputs) >= self.settings["max_outputs_per_cell"]:
+                removed_chars += self._output_size(output)
+                continue
+
+            if output.get("output_type") == "stream":
+                removed_chars += self._sanitize_text(output, "text")
+
+            elif output.get("output_type") == "error":
+                traceback = output.get("traceback", [])
+                output["traceback"] = [self._truncate("\n".join(traceback))]
+                removed_chars += len("\n".join(traceback)) - len(output["traceback"][0])
+
+            elif "data" in output:
+                for mime_type in list(output["data"].keys()):
+                    if mime_type in self.settings["drop_mime_types"]:
+                        dropped_data = output["data"].pop(mime_type)
+                        removed_chars += len(self._join_text(dropped_data)) if isinstance(dropped_data, (str, list)) else len(str(dropped_data))
+
+                    elif mime_type.startswith("text/"):
+                        removed_chars += self._sanitize_text(output["data"], mime_type)
+
+                # Output with only dropped data (e.g. a plot) is not needed
+                if not output["data"]:
+                    continue
+
+            sanitized_outputs.append(output)
+
+        cell["outputs"] = sanitized_outputs
+
+        return removed_chars
+
+
+    def _sanitize_text(self, container: dict[str, Any], key: str) -> int:
+        """
+        Function collapses repeated lines and truncates text saved under 'key'
+
+        Args:
+            container (dict[str, Any]): Output or its 'data' dict
+            key (str): Key of text in container
+
+        Returns:
+            int: Number of removed characters
+        """
+
+        text = self._join_text(container[key])
+        sanitized_text = self._collapse_log_lines(text) if self.settings["collapse_log_lines"] else text
+        sanitized_text = self._truncate(sanitized_text)
+        container[key] = sanitized_text
+
+        return len(text) - len(sanitized_text)
+
+
+    def _collapse_log_lines(self, text: str) -> str:
+        """
+        Function collapses runs of similar lines (equal apart from numbers)
+        The first and the last line of the run are kept
+
+        Args:
+            text (str): Output text
+
+        Returns:
+            str: Text with collapsed lines
+        """
+
+        lines = text.split("\n")
+        collapsed_lines = []
+        i = 0
+        while i < len(lines):
+            line_pattern = NUMBER_PATTERN.sub("#", lines[i])
+            j = i + 1
+            while j < len(lines) and NUMBER_PATTERN.sub("#", lines[j]) == line_pattern:
+                j += 1
+
+            if j - i >= self.settings["min_repeated_lines"]:
+                collapsed_lines.extend([lines[i], f"... ({j - i - 2} similar lines) ...", lines[j - 1]])
+            else:
+                collapsed_lines.extend(lines[i:j])
+            i = j
+
+        return "\n".join(collapsed_lines)
+
+
+    def _truncate(self, text: str) -> str:
+        """Function cuts text longer than 'max_output_chars', the beginning and the end are kept"""
+
+        max_output_chars = self.settings["max_output_chars"]
+        if len(text) <= max_output_chars:
+            return text
+
+        half = max_output_chars // 2
+        return f"{text[:half]}\n... ({len(text) - 2 * half} characters truncated) ...\n{text[-half:]}"
+
+
+    def _output_size(self, output: dict[str, Any]) -> int:
+        """Function returns approximate number of characters in output"""
+
+        if "data" in output:
+            return sum(len(self._join_text(value)) for value in output["data"].values() if isinstance(value, (str, list)))
+
+        if "traceback" in output:
+            return len("\n".join(output["traceback"]))
+
+        return len(self._join_text(output.get("text", "")))
+
+
+    def _join_text(self, text: str | list[str]) -> str:
+        """Function joins multiline text saved in notebook as list of lines"""
+
+        return "".join(text) if isinstance(text, list) else text
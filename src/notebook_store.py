@@ -0,0 +1,203 @@
+from typing import Any
+import threading
+import hashlib
+import time
+import json
+import gzip
+import os
+
+
+# Links of kernels in specifications start with it, the rest is the ref ("author/slug")
+KERNEL_LINK_PREFIX = "https://www.kaggle.com/code/"
+
+
+
+def make_kernel_ref(link: str) -> str:
+    """Function returns ref of the kernel ("author/slug") from its link (or the ref itself)"""
+
+    return link.removeprefix(KERNEL_LINK_PREFIX).strip("/")
+
+
+
+class NotebookStore:
+
+    # Shared by all objects in the process, each session creates its own store over the same directory
+    _lock = threading.Lock()
+    _last_retention = {}
+
+    def __init__(self, store_dir: str, compress: bool = True) -> None:
+        self.store_dir = store_dir
+        self.blobs_dir = os.path.join(store_dir, "blobs")
+        self.index_path = os.path.join(store_dir, "index.json")
+        self.compress = compress
+
+        os.makedirs(self.blobs_dir, exist_ok=True)
+
+
+    def _blob_path(self, blob_hash: str, compressed: bool) -> str:
+        """Function returns path of the blob, blobs are spread in subdirectories by hash prefix"""
+
+        return os.path.join(self.blobs_dir, blob_hash[:2], f"{blob_hash}.ipynb{'.gz' if compressed else ''}")
+
+
+    def _read_index(self) -> dict[str, dict[str, Any]]:
+        """Function reads index of kernel refs, an unreadable index is treated as empty"""
+
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+
+        except Exception as e:
+            return {}
+
+        # Entries are keyed by ref, slugs are not unique across authors and links were used by older indexes
+        # Broken entries are skipped, so they do not stop the page
+        refs_index = {}
+        for entry in index.values() if isinstance(index, dict) else []:
+            if not isinstance(entry, dict) or not isinstance(entry.get("ref"), str) or any(key not in entry for key in ("hash", "compressed", "size", "saved_at")):
+                continue
+
+            ref = make_kernel_ref(entry["ref"])
+            refs_index[ref] = {**entry, "ref" : ref}
+
+        return refs_index
+
+
+    def _write_index(self, index: dict[str, dict[str, Any]]) -> None:
+        """Function saves index atomically, so readers never see a partial file"""
+
+        tmp_path = f"{self.index_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=4)
+        os.replace(tmp_path, self.index_path)
+
+
+    def put(self, kernel_spec: dict[str, Any]) -> str:
+        """
+        Function saves notebook source as a blob addressed by hash of the kernel ref and the source
+        The same notebook is written only once, the index maps its ref to the blob
+
+        Args:
+            kernel_spec (dict[str, Any]): Dict with kernel specification
+
+        Returns:
+            str: Path of the blob
+        """
+
+        notebook_source = kernel_spec["source"]
+        blob_hash = hashlib.sha256(f"{kernel_spec['link']}\0{notebook_source}".encode("utf-8")).hexdigest()
+        blob_path = self._blob_path(blob_hash, self.compress)
+
+        # Blob and index are saved together, so retention never sees a blob without its entry
+        with NotebookStore._lock:
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                tmp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+                if self.compress:
+                    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                        f.write(notebook_source)
+                else:
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        f.write(notebook_source)
+                os.replace(tmp_path, blob_path)
+
+            ref = make_kernel_ref(kernel_spec["link"])
+            index = self._read_index()
+            if (entry := index.get(ref)) is not None and entry["hash"] == blob_hash and entry["compressed"] == self.compress:
+                return blob_path
+
+            index[ref] = {
+                "ref"        : ref,
+                "hash"       : blob_hash,
+                "compressed" : self.compress,
+                "size"       : os.path.getsize(blob_path),
+                "saved_at"   : time.time(),
+            }
+            self._write_index(index)
+
+        return blob_path
+
+
+    def get(self, ref: str) -> str | None:
+        """
+        Function returns notebook source saved for the kernel
+
+        Args:
+            ref (str): Ref of the kernel ("author/slug")
+
+        Returns:
+            str | None: Notebook in JSON format as text or None if it is not stored
+        """
+
+        if (entry := self._read_index().get(ref)) is None:
+            return None
+
+        blob_path = self._blob_path(entry["hash"], entry["compressed"])
+        try:
+            if entry["compressed"]:
+                with gzip.open(blob_path, "rt", encoding="utf-8") as f:
+                    return f.read()
+
+            with open(blob_path, "r", encoding="utf-8") as f:
+                return f.read()
+
+        except Exception as e:
+            return None
+
+
+    def apply_retention(self, max_age: float | None = None, max_total_bytes: int | None = None, interval: float = 0.0) -> None:
+        """
+        Function removes entries older than 'max_age' and then the oldest ones over 'max_total_bytes'
+        Blobs not used by any entry of the index are removed too. The index is saved only if it changed.
+
+        Args:
+            max_age (float | None, optional): Maximum age of entry in seconds. Defaults to None (no limit).
+            max_total_bytes (int | None, optional): Maximum size of all blobs. Defaults to None (no limit).
+            interval (float, optional): Minimum time between retentions of the directory in the process
+                                        in seconds. Defaults to 0.0 (always).
+        """
+
+        with NotebookStore._lock:
+            now = time.time()
+            last_retention = NotebookStore._last_retention.get(self.store_dir)
+            if last_retention is not None and now - last_retention < interval:
+                return
+
+            NotebookStore._last_retention[self.store_dir] = now
+            index = self._read_index()
+            kept_index = dict(index)
+
+            if max_age is not None:
+                kept_index = {ref: entry for ref, entry in kept_index.items() if now - entry["saved_at"] <= max_age}
+
+            if max_total_bytes is not None:
+                blob_sizes = {entry["hash"]: entry["size"] for entry in kept_index.values()}
+                total_size = sum(blob_sizes.values())
+                for ref, entry in sorted(kept_index.items(), key=lambda item: item[1]["saved_at"]):
+                    if total_size <= max_total_bytes:
+                        break
+
+                    del kept_index[ref]
+                    if entry["hash"] in blob_sizes and all(other["hash"] != entry["hash"] for other in kept_index.values()):
+                        total_size -= blob_sizes.pop(entry["hash"])
+
+            # Blobs are checked after removing entries and once in the process (e.g. blobs left by a crash)
+            if len(kept_index) == len(index) and last_retention is not None:
+                return
+
+            if kept_index != index:
+                self._write_index(kept_index)
+            used_hashes = {entry["hash"] for entry in kept_index.values()}
+
+            for root, _, files in os.walk(self.blobs_dir):
+                for file in files:
+                    # Temporary files of writes in progress are left alone
+                    if file.endswith(".tmp"):
+                        continue
+
+                    if file.split(".")[0] not in used_hashes:
+                        try:
+                            os.remove(os.path.join(root, file))
+
+                        except Exception as e:
+                            continue
@@ -1,7 +1,8 @@
 from dotenv import load_dotenv
 import streamlit as st
 import os
-import kaggle
+from clients import client_registry
+from health_check import health_checks
 from llm import LLM
 from kaggle_api import MyKaggleApi
 import keyboard
@@ -59,53 +60,57 @@ with st.sidebar:
         )
 
 
-# If the '.kaggle' file is found and the API is working
-if not st.session_state["API_STATUS"]["KAGGLE_CHECKED"]:
-    api = kaggle.KaggleApi()
-    api.authenticate()
-    
-    try:
-        api.kernels_list(page=1, page_size=1)
-        
-    except Exception as e:
-        st.session_state["API_STATUS"]["KAGGLE_CHECKED"] = True
-        st.session_state["API_STATUS"]["KAGGLE_WORKS"] = False
+# Status of APIs is checked in the background and shared by sessions, the page reads the last known one
+kaggle_status = health_checks.get_status(
+    name="kaggle",
+    credentials=client_registry.get_kaggle_credentials_key(),
+    probe=lambda: client_registry.get_kaggle_api().kernels_list(page=1, page_size=1)
+)
 
-    else:
-        st.session_state["API_STATUS"]["KAGGLE_CHECKED"] = True
-        st.session_state["API_STATUS"]["KAGGLE_WORKS"] = True
-        
-        
 
-# Create object of Kaggle API every refresh
-if st.session_state["API_STATUS"]["KAGGLE_CHECKED"] and st.session_state["API_STATUS"]["KAGGLE_WORKS"]:
-    api = kaggle.KaggleApi()
-    api.authenticate()
+def check_gemini_api(api_key: str) -> None:
+    """Probe of Gemini API - listing models fails with invalid API Key"""
     
-    st.session_state["API_OBJECTS"]["KAGGLE_OBJECT"] = my_kaggle_api
-    my_kaggle_api.load_api(api)
+    probe_llm = LLM()
+    probe_llm.connect_client(api_key)
+    probe_llm.get_models_list()
+
+
+gemini_api_key = os.environ.get("GEMINI_API", "")
+gemini_status = health_checks.get_status(
+    name="gemini",
+    credentials=gemini_api_key,
+    probe=lambda: check_gemini_api(gemini_api_key)
+)
 
+st.session_state["API_STATUS"].update({
+    "KAGGLE_CHECKED" : kaggle_status is not None,
+    "KAGGLE_WORKS" :   kaggle_status is True,
+    "GEMINI_CHECKED" : gemini_status is not None,
+    "GEMINI_WORKS" :   gemini_status is True,
+})
 
-# If the Gemini API works
-if not st.session_state["API_STATUS"]["GEMINI_CHECKED"]:
 
-    try:
-        llm.connect_client(os.environ.get("GEMINI_API", ""))
-        llm.get_models_list()
-                
-    except Exception as e:
-        st.session_state["API_STATUS"]["GEMINI_CHECKED"] = True
-        st.session_state["API_STATUS"]["GEMINI_WORKS"] = False
-                    
-    else:
-        st.session_state["API_STATUS"]["GEMINI_CHECKED"] = True
-        st.session_state["API_STATUS"]["GEMINI_WORKS"] = True
+# Borrow shared Kaggle API every refresh, it is authenticated once per process
+if st.session_state["API_STATUS"]["KAGGLE_CHECKED"] and st.session_state["API_STATUS"]["KAGGLE_WORKS"]:
+    st.session_state["API_OBJECTS"]["KAGGLE_OBJECT"] = my_kaggle_api
+    my_kaggle_api.connect()
 
 
 # Loading setting of Gemini API
-if st.session_state["API_STATUS"]["GEMINI_CHECKED"] and st.session_state["API_STATUS"]["GEMINI_WORKS"] and load_dotenv():
+if st.session_state["API_STATUS"]["GEMINI_CHECKED"] and st.session_state["API_STATUS"]["GEMINI_WORKS"]:
     st.session_state["API_OBJECTS"]["LLM_OBJECT"] = llm
-    llm.connect_client(os.environ.get("GEMINI_API", ""))
+    llm.connect_client(gemini_api_key)
+
+
+# Wait for the first check of APIs without blocking on remote calls
+if kaggle_status is None or gemini_status is None:
+    st.info(
+        body="Checking Kaggle and Gemini API...",
+        icon="⏳"
+    )
+    time.sleep(.5)
+    st.rerun()
     
 
 # Call error with Kaggle API
@@ -140,6 +145,13 @@ with st.columns(2)[0]:
     top_k = st.session_state["MODEL_SETTINGS"]["TOP_P"] if has_mode_settings else 0.80
     top_p = st.session_state["MODEL_SETTINGS"]["TOP_K"] if has_mode_settings else 32
 
+    # List of models is cached, it can be fetched again on demand
+    if st.button(
+        label="Refresh models",
+        icon="🔄"
+    ):
+        llm.refresh_model_catalog()
+
     available_llm_models = llm.get_models_list()
     selected_model = st.selectbox(
         label="Gemini Models",
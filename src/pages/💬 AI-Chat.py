@@ -1,6 +1,8 @@
-import os
 import streamlit as st
 from data_maker import DataMaker
+from chat_store import ChatStore
+from attachments import AttachmentProcessor
+from config import PathVariable, CHAT_RENDER_LIMIT, CHAT_SESSIONS_LIMIT
 
 
 st.set_page_config(
@@ -24,14 +26,35 @@ with st.sidebar:
         )
 
 
-if "MODEL_SETTINGS" in st.session_state and "API_OBJECTS" in st.session_state:
+GREETING_MESSAGE = {"role"   : "assistant", 
+                    "content" : "Hey!<br>How can I help you?<br>You can ask and attach a Markdown or Notebook file",
+                    "avatar"  : "🧠"}
 
-    # This 'if' protects against recreating the chat session
-    if st.session_state["API_STATUS"]["CHAT_LLM"] is False:
-        st.session_state["API_OBJECTS"]["LLM_OBJECT"].create_chat(st.session_state["MODEL_SETTINGS"]["NAME"])
-        st.session_state["API_STATUS"]["CHAT_LLM"] = True
+
+def open_chat_session(chat_store: ChatStore, session_id: str) -> None:
+    """
+    Function loads the latest messages of the session, the chat with the model is created again on this run
+
+    Args:
+        chat_store (ChatStore): Store of chat sessions
+        session_id (str): ID of the session
+    """
+
+    messages = chat_store.load_messages(session_id, limit=CHAT_RENDER_LIMIT + 1)
+    st.session_state["CHAT_SESSION_ID"] = session_id
+    st.session_state["CHAT_HAS_OLDER"] = len(messages) > CHAT_RENDER_LIMIT
+    st.session_state["messages"] = messages[-CHAT_RENDER_LIMIT:]
+    st.session_state["API_STATUS"]["CHAT_LLM"] = False
+
+
+if "MODEL_SETTINGS" in st.session_state and "API_OBJECTS" in st.session_state:
 
     maker = DataMaker()
+    chat_store = ChatStore(PathVariable.CHAT_PATH.value)
+
+    # Messages are saved in the store, the session keeps only the rendered ones
+    if "CHAT_SESSION_ID" not in st.session_state:
+        open_chat_session(chat_store, chat_store.new_session())
 
     st.markdown("""
     # 💬 AI-Chat
@@ -39,46 +62,95 @@ if "MODEL_SETTINGS" in st.session_state and "API_OBJECTS" in st.session_state:
     """)
 
     with st.sidebar:
+        if st.session_state.get("CHAT_CORPUS") is not None:
+            st.caption("Chat about notebooks from Notebook-Creator")
+
         if st.button(label="Clear chat", icon="🧹"):
-            st.session_state["messages"] = [{"role"   : "assistant", 
-                                            "content" : "Hey!<br>How can I help you?<br>You can ask and attach a Markdown or Notebook file",
-                                            "avatar"  : "🧠"}]
-            st.session_state["API_OBJECTS"]["LLM_OBJECT"].create_chat(st.session_state["MODEL_SETTINGS"]["NAME"])
+            st.session_state.pop("CHAT_CORPUS", None)
+            open_chat_session(chat_store, chat_store.new_session())
+
+        # Saved sessions can be continued, also after restart of the app
+        sessions = [st.session_state["CHAT_SESSION_ID"]] + [
+            session_id for session_id in chat_store.list_sessions(limit=CHAT_SESSIONS_LIMIT)
+            if session_id != st.session_state["CHAT_SESSION_ID"]
+        ]
+        selected_session = st.selectbox(
+            label="Chat history",
+            options=sessions,
+            index=0,
+            format_func=lambda session_id: chat_store.get_session_title(session_id)
+        )
+        if selected_session != st.session_state["CHAT_SESSION_ID"]:
+            st.session_state.pop("CHAT_CORPUS", None)
+            open_chat_session(chat_store, selected_session)
 
+    # This 'if' protects against recreating the chat session
+    # Notebooks chosen in Notebook-Creator are given to the chat through the context cache
+    # History of the model is made of the texts sent to it (with attachments), not of the rendered messages
+    if st.session_state["API_STATUS"]["CHAT_LLM"] is False:
+        chat_summary, model_history = chat_store.load_model_history(st.session_state["CHAT_SESSION_ID"])
+        st.session_state["API_OBJECTS"]["LLM_OBJECT"].create_chat(
+            st.session_state["MODEL_SETTINGS"]["NAME"],
+            corpus=st.session_state.get("CHAT_CORPUS"),
+            history=model_history,
+            summary=chat_summary
+        )
+        st.session_state["CHAT_SUMMARY"] = chat_summary
+        st.session_state["API_STATUS"]["CHAT_LLM"] = True
 
-    # Make messages history for AI
-    if "messages" not in st.session_state:
-        st.session_state["messages"] = [{"role"   : "assistant", 
-                                        "content" : "Hey!<br>How can I help you?<br>You can ask and attach a Markdown or Notebook file",
-                                        "avatar"  : "🧠"}]
+    # Older messages are read from the store only on demand
+    if st.session_state["CHAT_HAS_OLDER"]:
+        if st.button(label="Load older messages", icon="⬆️"):
+            older_messages = chat_store.load_messages(
+                st.session_state["CHAT_SESSION_ID"],
+                limit=CHAT_RENDER_LIMIT + 1,
+                skip=len(st.session_state["messages"])
+            )
+            st.session_state["CHAT_HAS_OLDER"] = len(older_messages) > CHAT_RENDER_LIMIT
+            st.session_state["messages"] = older_messages[-CHAT_RENDER_LIMIT:] + st.session_state["messages"]
+            st.rerun()
+    else:
+        st.chat_message(
+            name=GREETING_MESSAGE["role"],
+            avatar=GREETING_MESSAGE["avatar"]
+        ).write(GREETING_MESSAGE["content"], unsafe_allow_html=True)
 
-    # Display initial message from AI
+    # Display loaded messages
     for msg in st.session_state["messages"]:
         st.chat_message(
             name=msg["role"],
             avatar=msg["avatar"]
         ).write(msg["content"], unsafe_allow_html=True)
         
-
     # Get user input
     if user_prompt := st.chat_input(
         placeholder="Your question...(max 512 chars)", 
         max_chars=512, 
-        accept_file=True, 
+        accept_file="multiple", 
         file_type=["ipynb", "md"]
     ):
         
         if user_prompt["files"]:
-            user_message_display = f"📎File: **{user_prompt["files"][0].name}**<br>{user_prompt["text"]}" # type: ignore
-            if os.path.splitext(user_prompt["files"][0].name)[1] == ".ipnyb": # type: ignore
-                loaded_md_file = maker.convert_ipynb_to_markdown(user_prompt["files"][0].getvalue().decode("utf-8")) # type: ignore
+            # Files are converted in memory, the same content attached again is taken from the cache
+            attachment_processor = AttachmentProcessor(maker)
+            attachments = attachment_processor.process_files(user_prompt["files"]) # type: ignore
+            for failed_attachment in attachment_processor.failed_attachments:
+                st.warning(
+                    body=f"Skipped File {failed_attachment['name']}: {failed_attachment['error']}",
+                    icon="⚠️"
+                )
 
-            else:
-                loaded_md_file = user_prompt["files"][0].getvalue().decode("utf-8") # type: ignore
-
-            user_message_llm = f"{user_prompt["text"]}<br><br>File as Markdown:<br>{loaded_md_file}"
+            user_message_display = user_prompt["text"]
+            if attachments:
+                user_message_display = f"📎File: {", ".join(f"**{attachment["name"]}**" for attachment in attachments)}<br>{user_message_display}"
+            # Files already sent in the chat are referenced, their new versions are sent as diffs
+            user_message_llm = user_prompt["text"] + "".join(
+                f"<br><br>{attachment_processor.make_attachment_prompt(attachment, st.session_state["API_OBJECTS"]["LLM_OBJECT"].chat_attachments)}"
+                for attachment in attachments
+            )
 
         else:
+            attachments = []
             user_message_display = user_prompt["text"]
             user_message_llm = user_message_display
 
@@ -90,18 +162,31 @@ if "MODEL_SETTINGS" in st.session_state and "API_OBJECTS" in st.session_state:
         st.session_state["messages"].append({"role"  : "user", 
                                             "content": user_message_display,
                                             "avatar" : "😎"})
+        chat_store.append(
+            st.session_state["CHAT_SESSION_ID"],
+            {**st.session_state["messages"][-1], "llm_content" : user_message_llm} if user_message_llm != user_message_display else st.session_state["messages"][-1]
+        )
         
-        llm_response = st.session_state["API_OBJECTS"]["LLM_OBJECT"].send_message(user_message_llm)
+        # Answer is shown chunk by chunk, 'write_stream' returns the whole text for history
         with st.chat_message("assistant", avatar="🧠"):
-            ai_response = st.write(
-                llm_response, 
-                unsafe_allow_html=True
+            llm_response = st.write_stream(
+                st.session_state["API_OBJECTS"]["LLM_OBJECT"].send_message_stream(user_message_llm)
             )
 
         st.session_state["messages"].append({"role"  : "assistant", 
                                             "content": llm_response,
                                             "avatar" : "🧠"})
-        
-
-        # TO-DO
-        # Save chat history
\ No newline at end of file
+        for attachment in attachments:
+            st.session_state["API_OBJECTS"]["LLM_OBJECT"].remember_chat_attachment(attachment)
+        chat_store.append(st.session_state["CHAT_SESSION_ID"], st.session_state["messages"][-1])
+
+        # Summary of compacted history is saved, so the continued session does not load the old messages again
+        llm_object = st.session_state["API_OBJECTS"]["LLM_OBJECT"]
+        if llm_object.chat_summary is not None and llm_object.chat_summary != st.session_state.get("CHAT_SUMMARY"):
+            chat_store.save_summary(st.session_state["CHAT_SESSION_ID"], llm_object.chat_summary, llm_object.chat_message_count)
+        st.session_state["CHAT_SUMMARY"] = llm_object.chat_summary
+
+        # Only the latest messages stay rendered, the rest is in the store
+        if len(st.session_state["messages"]) > CHAT_RENDER_LIMIT:
+            st.session_state["messages"] = st.session_state["messages"][-CHAT_RENDER_LIMIT:]
+            st.session_state["CHAT_HAS_OLDER"] = True
\ No newline at end of file
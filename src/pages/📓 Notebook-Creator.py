@@ -1,5 +1,7 @@
 from data_maker import DataMaker
-from config import PathVariable
+from job_runner import Job, job_runner
+from notebook_pipeline import run_notebook_generation, make_job_key, corpus_cache
+from config import PathVariable, JOB_POLL_INTERVAL
 import streamlit as st
 import os
 
@@ -59,8 +61,9 @@ if start_main_section:
     with inputs_columns_first_row[0]:
         selected_mode = st.selectbox(
             label="Mode",
-            options=["Generate the notebook"],
-            placeholder="Select a mode"
+            options=["Generate the notebook", "Generate the notebook (long-context)"],
+            placeholder="Select a mode",
+            help="Long-context mode summarizes all notebooks in parallel shards and generates the notebook from their digests"
         )
        
     ## Make subcolumns for input surce
@@ -94,6 +97,7 @@ if start_main_section:
         )
         selected_page_num  = page_columns[0].number_input(
             label="Pages",
+            help="Number of following pages to fetch, starting from the first one",
             min_value=1,
             max_value=10,
             step=1,
@@ -124,6 +128,9 @@ if start_main_section:
             
     st.markdown("---")
     
+    if "NOTEBOOK_JOBS" not in st.session_state:
+        st.session_state["NOTEBOOK_JOBS"] = []
+
     if start_main_section and start_button:
         if (selected_dataset and selected_competition) or (selected_dataset == "" and selected_competition == ""):
             with st.columns(3)[1]:
@@ -132,158 +139,132 @@ if start_main_section:
                     icon="🚨"
                 )
                 st.stop()
-        
-        with st.spinner("Processing data..."):
-            # Config for getting kernels (notebooks) list       
-            my_kaggle_api_config = {
-                "page"      : selected_page_num,
-                "page_size" : selected_page_size,
-                "language"  : "python",
-                "sort_by"   : str(selected_page_sort)
-            }
-        
-            # Config for LLM model
-            model_params = {
+
+        # Config of the pipeline, it runs in the background and the page only shows its status
+        job_settings = {
+            "dataset"          : selected_dataset.strip(),
+            "competition"      : selected_competition.strip(),
+            "page_num"         : selected_page_num,
+            "page_size"        : selected_page_size,
+            "sort_by"          : str(selected_page_sort),
+            "model_name"       : selected_model,
+            "max_input_tokens" : max_input_tokens,
+            "mode"             : "map_reduce" if selected_mode == "Generate the notebook (long-context)" else "single",
+            "model_params"     : {
                 "temperature" : selected_temperature,
                 "top_p" : selected_top_p,
                 "top_k" : selected_top_k,
                 "max_output_tokens" : max_output_tokens
             }
-                
-            if selected_dataset:
-                kernels_list = st.session_state["API_OBJECTS"]["KAGGLE_OBJECT"].get_kernels_list(
-                    dataset=selected_dataset,
-                    **my_kaggle_api_config
-                )
-                if len(kernels_list) == 0:
-                    with st.columns(3)[1]:
-                        st.error(
-                            body="No Dataset Notebooks Detected",
-                            icon="🚨"
-                        )
-                        st.stop()
-                            
-                kernels_metadata = st.session_state["API_OBJECTS"]["KAGGLE_OBJECT"].get_kernels_specification(kernels_list)
-                    
-            else:
-                kernels_list = st.session_state["API_OBJECTS"]["KAGGLE_OBJECT"].get_kernels_list(
-                    competition=selected_competition,
-                    **my_kaggle_api_config
-                )
-                if len(kernels_list) == 0:
-                    with st.columns(3)[1]:
-                        st.error(
-                            body="No Competition Notebooks Detected",
-                            icon="🚨"
-                        )
-                        st.stop()
-                            
-                kernels_metadata = st.session_state["API_OBJECTS"]["KAGGLE_OBJECT"].get_kernels_specification(kernels_list)
-             
-            # Save 'source' in JSON to .ipynb file
-            for metadata in kernels_metadata:
-                if not maker.download_notebook(metadata):
-                    with st.columns(3)[1]:
-                        st.error(
-                            body="Error With Saving Notebook",
-                            icon="🚨"
-                        )
-                        st.stop()
-                            
-            # Load file base on mode - generate new or upgrade own notebook
-            file_mode = "generate_notebook_prompt.txt"
-            
-            # Ready to use prompt
-            if isinstance(prompt := maker.make_notebook_generator_prompt(
-                kernels_spec=kernels_metadata, 
-                file_instruction=file_mode
-            ), bool):
-                st.error(
-                    body="Error With Making Prompt",
-                    icon="🚨"
-                )
-                st.stop()
+        }
+        job_id = job_runner.submit(
+            selected_dataset if selected_dataset else selected_competition,
+            run_notebook_generation,
+            st.session_state["API_OBJECTS"]["KAGGLE_OBJECT"],
+            st.session_state["API_OBJECTS"]["LLM_OBJECT"],
+            job_settings,
+            key=make_job_key(job_settings)
+        )
+
+        # The same request already running (e.g. started by another user) is joined instead of started again
+        if job_id not in st.session_state["NOTEBOOK_JOBS"]:
+            st.session_state["NOTEBOOK_JOBS"].insert(0, job_id)
+
+    # Show ready notebooks (kept when the page is refreshed by finished jobs)
+    elif start_main_section and display_generated_notebook:
+        st.session_state["SHOWN_NOTEBOOK"] = selected_generated_notebook
+
+
+    def show_job(job: Job) -> None:
+        """
+        Function shows status, messages and result of the job
+
+        Args:
+            job (Job): Job of notebook generation
+        """
+
+        with st.container(border=True):
+            st.markdown(f"#### 📑 {job.name}")
+
+            for level, text in list(job.messages):
+                if level == "warning":
+                    st.warning(body=text, icon="⚠️")
+                elif level == "info":
+                    st.info(body=text, icon="ℹ️")
+                else:
+                    st.caption(text)
+
+            if not job.is_finished():
+                st.progress(job.progress, text=job.stage)
 
-            # Limit prompt to model limit tokens
-            if st.session_state["API_OBJECTS"]["LLM_OBJECT"].count_tokens(selected_model, prompt) > max_input_tokens:
+                # Sections are shown as soon as they are streamed by the model
+                if sections := list(job.sections):
+                    st.markdown("".join(sections))
+                return
+
+            if st.button(label="Close", icon="✖️", key=f"close-{job.job_id}"):
+                st.session_state["NOTEBOOK_JOBS"].remove(job.job_id)
+                st.rerun(scope="fragment")
+
+            if job.status == "failed":
                 st.error(
-                    body="To Many Input Tokens. Chnage 'Pages' or 'Page Size'",
+                    body=job.error,
                     icon="🚨"
                 )
-                st.stop()
+                return
 
-            # Loop for generating output if LLM return invalid JSON format
-            while True:
-                if not isinstance(response := st.session_state["API_OBJECTS"]["LLM_OBJECT"].generate_notebook(
-                    selected_model,
-                    prompt,
-                    **model_params
-                ), bool):
-                    break
-                
-       
-        # Main container contains information
-        with st.container(border=True):
-            st.markdown("#### 📑 Generated Notebook")
-            
-            save_columns = st.columns(4)
-            right_tabs_text , right_tabs_json= st.tabs(["📝 Text", "💻 JSON"])
-            
-            # SECTION FOR MAKING TEMPLATE FOR GENERATED DATA #
-            try:
-                # Read template for analyzed notebooks
-                with open(
-                    file=os.path.join(PathVariable.TEMPLATE_PATH.value, "generated_notebook_template.txt"), 
-                    mode="r", 
-                    encoding="utf-8"
-                ) as f:
-                    generated_template = f.read()
-                    
-            except Exception as e:
-                with st.columns(3)[1]:
-                    st.error(
-                        body="Error Reading Template - generated_notebook_template.txt",
-                        icon="🚨"
+            result_columns = st.columns(4)
+            result_columns[0].info(
+                body="Saved",
+                icon="✔️"
+            )
+
+            # Chat about the same notebooks reuses their context cache
+            if job.result["corpus_key"] is not None and result_columns[1].button(label="Ask in AI-Chat", icon="💬", key=f"chat-{job.job_id}"):
+                if (corpus_entry := corpus_cache.get(job.result["corpus_key"])) is None:
+                    st.warning(
+                        body="Notebooks of this job are no longer available. Generate the notebook again",
+                        icon="⚠️"
                     )
-                    st.stop()
+                else:
+                    st.session_state["CHAT_CORPUS"] = corpus_entry["corpus"]
+                    st.session_state["API_STATUS"]["CHAT_LLM"] = False
+                    st.switch_page(os.path.join(PathVariable.PAGES_PATH.value, "💬 AI-Chat.py"))
+
+            right_tabs_text , right_tabs_json= st.tabs(["📝 Text", "💻 JSON"])
 
             # Tab with text
             with right_tabs_text:
-                md_generated_notebook = maker.format_generated_notebook(
-                    generated_notebook_data=response.get("new_notebook"), 
-                    template=generated_template
-                )
-                st.markdown(md_generated_notebook)
+                st.markdown(job.result["markdown"])
 
             # Tab with JSON
             with right_tabs_json:
                 st.json(
-                    body=response.get("new_notebook"),
+                    body=job.result["new_notebook"],
                     expanded=False
                 )
-                
-            # Save notebook to 'Save'
-            name = selected_dataset if selected_dataset else selected_competition
-            if maker.save_new_markdown(
-                markdown_text=md_generated_notebook, 
-                name=name
-            ):
-                save_columns[0].info(
-                    body="Saved",
-                    icon="✔️"
-                )
 
-            else:
-                save_columns[0].error(
-                    body="Saving Error",
-                    icon="🚨"
-                )
-                st.stop()
 
-    # Show ready notebooks
-    elif start_main_section and display_generated_notebook:
+    # Jobs which are not known by the runner any more are forgotten, their notebooks are in 'Ready Notebooks'
+    st.session_state["NOTEBOOK_JOBS"] = [job_id for job_id in st.session_state["NOTEBOOK_JOBS"] if job_runner.get_job(job_id) is not None]
+    jobs_running = any(not job_runner.get_job(job_id).is_finished() for job_id in st.session_state["NOTEBOOK_JOBS"])
+
+    # Only this part of the page is refreshed while jobs are running
+    @st.fragment(run_every=JOB_POLL_INTERVAL if jobs_running else None)
+    def show_jobs() -> None:
+        jobs = [job for job_id in st.session_state["NOTEBOOK_JOBS"] if (job := job_runner.get_job(job_id)) is not None]
+        for job in jobs:
+            show_job(job)
+
+        # Whole page is refreshed when the last job ends, so polling stops and new notebook is listed
+        if jobs_running and all(job.is_finished() for job in jobs):
+            st.rerun()
+
+    show_jobs()
+
+    if start_main_section and st.session_state.get("SHOWN_NOTEBOOK") in maker.get_notebooks_list():
         with open(
-            file=os.path.join(PathVariable.SAVE_PATH.value, selected_generated_notebook),
+            file=os.path.join(PathVariable.SAVE_PATH.value, st.session_state["SHOWN_NOTEBOOK"]),
             mode="r",
             encoding="utf-8"
         ) as f:
@@ -292,4 +273,3 @@ if start_main_section:
         with st.tabs(["📝 Text", " "])[0]:
             with st.container(border=True):
                 st.markdown(open_notebook)
-        
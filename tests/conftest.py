@@ -0,0 +1,13 @@
+import tempfile
+import sys, os
+
+
+# Modules of the app are imported by bare names, like in 'src/main.py'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+# Assets (e.g. caches) are made next to the main script of the app, tests keep them in a temporary directory
+sys.argv[0] = os.path.join(tempfile.mkdtemp(prefix="ai-kaggle-assistant-"), "main.py")
+
+# 'kaggle' authenticates when it is imported, placeholder credentials are enough for tests without Kaggle API
+os.environ.setdefault("KAGGLE_USERNAME", "test")
+os.environ.setdefault("KAGGLE_KEY", "test")
@@ -0,0 +1,204 @@
+from types import SimpleNamespace
+import pytest
+import json
+import time
+
+
+pytest.importorskip("google.genai")
+pytest.importorskip("json_repair")
+
+from google.genai import errors
+from llm import LLM, RetryPolicy
+from config import CONTEXT_CACHE_SETTINGS
+
+
+MODEL_NAME = "models/fake-model"
+
+# Large enough to be cached ('min_tokens'), without calibration there are 4 characters per token
+CORPUS = "<notebook>x = 1</notebook>" * 1000
+
+NOTEBOOK = {
+    "new_notebook" : {
+        "title"           : "Title",
+        "sections"        : [{"name" : "Load", "description" : "Load data", "code" : "x = 1", "explanation" : "Data"}],
+        "optimizations"   : {"implemented" : [], "future" : []},
+        "lessons_learned" : [],
+    },
+}
+
+
+def make_not_found_error() -> errors.ClientError:
+    return errors.ClientError(404, {"error" : {"code" : 404, "message" : "CachedContent not found (or permission denied)", "status" : "NOT_FOUND"}})
+
+
+def make_rate_limit_error() -> errors.ClientError:
+    return errors.ClientError(429, {"error" : {"code" : 429, "message" : "Resource exhausted", "status" : "RESOURCE_EXHAUSTED"}})
+
+
+
+class FakeCaches:
+
+    def __init__(self) -> None:
+        self.created = []
+        self.deleted = []
+        self.removed_on_server = set()
+
+    def create(self, model, config):
+        self.created.append(config)
+        return SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+
+    def delete(self, name):
+        self.deleted.append(name)
+
+
+
+class FakeModels:
+
+    def __init__(self, caches: FakeCaches) -> None:
+        self.caches = caches
+        self.errors = []
+        self.configs = []
+
+    def generate_content_stream(self, model, contents, config):
+        self.configs.append(config)
+        if self.errors:
+            raise self.errors.pop(0)
+        if config.cached_content in self.caches.removed_on_server:
+            raise make_not_found_error()
+
+        yield SimpleNamespace(text=json.dumps(NOTEBOOK))
+
+
+
+class FakeChat:
+
+    def __init__(self, caches: FakeCaches, config, history) -> None:
+        self.caches = caches
+        self.config = config
+        self.history = list(history)
+
+    def get_history(self):
+        return self.history
+
+    def send_message_stream(self, prompt):
+        if self.config is not None and self.config.cached_content in self.caches.removed_on_server:
+            raise make_not_found_error()
+
+        yield SimpleNamespace(text="Answer")
+        self.history.extend([prompt, "Answer"])
+
+
+
+class FakeChats:
+
+    def __init__(self, caches: FakeCaches) -> None:
+        self.caches = caches
+        self.opened = []
+
+    def create(self, model, config, history):
+        self.opened.append(FakeChat(self.caches, config, history))
+        return self.opened[-1]
+
+
+
+class FakeClient:
+
+    def __init__(self) -> None:
+        self.caches = FakeCaches()
+        self.models = FakeModels(self.caches)
+        self.chats = FakeChats(self.caches)
+
+
+
+@pytest.fixture
+def llm():
+    LLM._context_caches.clear()
+    LLM._context_create_locks.clear()
+
+    llm = LLM()
+    llm.client = FakeClient()
+    llm.credential_key = "test"
+    llm.is_connected = True
+
+    yield llm
+
+    LLM._context_caches.clear()
+
+
+def generate(llm: LLM) -> list[tuple[str, object]]:
+    return list(llm.generate_notebook_with_retry(
+        MODEL_NAME,
+        "Generate notebook",
+        retry_policy=RetryPolicy(max_attempts=2, base_delay=0.0),
+        use_cache=False,
+        corpus=CORPUS
+    ))
+
+
+def test_context_cache_is_created_once(llm):
+    cache_name = llm.get_context_cache(MODEL_NAME, CORPUS)
+
+    assert cache_name == llm.get_context_cache(MODEL_NAME, CORPUS)
+    assert len(llm.client.caches.created) == 1
+
+
+def test_small_corpus_is_not_cached(llm):
+    assert llm.get_context_cache(MODEL_NAME, "<notebook>x = 1</notebook>") is None
+    assert llm.client.caches.created == []
+
+
+def test_context_cache_is_created_again_before_expiry(llm):
+    first_name = llm.get_context_cache(MODEL_NAME, CORPUS)
+    LLM._context_caches[llm._make_context_key(MODEL_NAME, CORPUS)]["expires_at"] = time.time() + CONTEXT_CACHE_SETTINGS["refresh_margin"] - 1
+
+    assert not llm.is_context_cache_alive(MODEL_NAME, CORPUS, first_name)
+    assert llm.get_context_cache(MODEL_NAME, CORPUS) != first_name
+    assert len(llm.client.caches.created) == 2
+
+
+def test_invalidate_context_cache_deletes_it(llm):
+    cache_name = llm.get_context_cache(MODEL_NAME, CORPUS)
+    llm.invalidate_context_cache(MODEL_NAME, CORPUS)
+
+    assert llm.client.caches.deleted == [cache_name]
+    assert not llm.is_context_cache_alive(MODEL_NAME, CORPUS, cache_name)
+
+
+def test_generation_keeps_cache_after_rate_limit(llm):
+    llm.client.models.errors = [make_rate_limit_error()]
+
+    assert generate(llm)[-1] == ("notebook", NOTEBOOK)
+    assert llm.client.caches.deleted == []
+    assert len(llm.client.caches.created) == 1
+
+
+def test_generation_recreates_cache_not_found(llm):
+    removed_name = llm.get_context_cache(MODEL_NAME, CORPUS)
+    llm.client.caches.removed_on_server.add(removed_name)
+
+    assert generate(llm)[-1] == ("notebook", NOTEBOOK)
+    assert llm.client.caches.deleted == [removed_name]
+    assert llm.client.models.configs[-1].cached_content != removed_name
+
+
+def test_chat_recovers_from_cache_removed_on_server(llm):
+    llm.create_chat(MODEL_NAME, corpus=CORPUS)
+    list(llm.send_message_stream("First question"))
+    removed_name = llm.chat_cache_name
+    llm.client.caches.removed_on_server.add(removed_name)
+
+    assert "".join(llm.send_message_stream("Second question")) == "Answer"
+    assert llm.chat_cache_name not in (None, removed_name)
+    assert llm.chat.get_history() == ["First question", "Answer", "Second question", "Answer"]
+
+
+def test_chat_uses_new_cache_after_invalidation(llm):
+    llm.create_chat(MODEL_NAME, corpus=CORPUS)
+    list(llm.send_message_stream("First question"))
+    first_name = llm.chat_cache_name
+    llm.invalidate_context_cache(MODEL_NAME, CORPUS)
+
+    list(llm.send_message_stream("Second question"))
+
+    assert llm.chat.config.cached_content not in (None, first_name)
+    assert llm.chat.get_history() == ["First question", "Answer", "Second question", "Answer"]
@@ -0,0 +1,67 @@
+from notebook_converter import NotebookConverter
+import pytest
+import json
+import re
+
+
+pytest.importorskip("nbconvert")
+pytestmark = pytest.mark.filterwarnings("ignore::nbformat.validator.MissingIDFieldWarning")
+
+
+def make_notebook(cells: list[dict]) -> dict:
+    return {
+        "cells"          : cells,
+        "metadata"       : {"language_info" : {"name" : "python"}},
+        "nbformat"       : 4,
+        "nbformat_minor" : 5,
+    }
+
+
+# Sources and outputs are saved as lists of lines, like in .ipynb files
+SAMPLE_NOTEBOOKS = {
+    "markdown_and_code" : make_notebook([
+        {"cell_type" : "markdown", "metadata" : {}, "source" : ["# Title\n", "\n", "Some text"]},
+        {"cell_type" : "code", "metadata" : {}, "execution_count" : 1, "source" : ["import pandas as pd\n", "x = 1"], "outputs" : []},
+    ]),
+    "stream_and_result" : make_notebook([
+        {"cell_type" : "code", "metadata" : {}, "execution_count" : 1, "source" : ["print('a')\n", "1 + 2"], "outputs" : [
+            {"output_type" : "stream", "name" : "stdout", "text" : ["a\n", "b\n"]},
+            {"output_type" : "execute_result", "execution_count" : 1, "metadata" : {}, "data" : {"text/plain" : ["3"]}},
+        ]},
+    ]),
+    "error" : make_notebook([
+        {"cell_type" : "code", "metadata" : {}, "execution_count" : 1, "source" : "1 / 0", "outputs" : [
+            {"output_type" : "error", "ename" : "ZeroDivisionError", "evalue" : "division by zero",
+             "traceback" : ["\x1b[0;31mZeroDivisionError\x1b[0m: division by zero"]},
+        ]},
+    ]),
+}
+
+
+def normalize_markdown(markdown: str) -> str:
+    # Backends differ only in number of blank lines between cells and outputs
+    return re.sub(r"\n\s*\n", "\n\n", markdown).strip()
+
+
+@pytest.mark.parametrize("name", SAMPLE_NOTEBOOKS)
+def test_nbconvert_backend_accepts_raw_json(name):
+    body = NotebookConverter("nbconvert").convert_source(json.dumps(SAMPLE_NOTEBOOKS[name]))
+
+    assert isinstance(body, str) and body.strip()
+
+
+@pytest.mark.parametrize("name", SAMPLE_NOTEBOOKS)
+def test_native_backend_matches_nbconvert(name):
+    source = json.dumps(SAMPLE_NOTEBOOKS[name])
+
+    native_markdown = NotebookConverter("native").convert_source(source)
+    nbconvert_markdown = NotebookConverter("nbconvert").convert_source(source)
+
+    assert normalize_markdown(native_markdown) == normalize_markdown(nbconvert_markdown)
+
+
+def test_native_cells_join_to_notebook():
+    converter = NotebookConverter("native")
+    notebook = SAMPLE_NOTEBOOKS["markdown_and_code"]
+
+    assert "\n\n".join(converter.convert_notebook_cells(notebook)) + "\n" == converter.convert_notebook(notebook)